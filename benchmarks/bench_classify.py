@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of special string classification on string-heavy documents.
+
+Compares the single-pass cached classifier against matching each special
+string regex in turn and re-running the winning one to pull out its groups.
+"""
+
+import os
+import random
+import re
+import sys
+import timeit
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from evegenie.classify import classify_string, _classify_special
+
+
+objectidregex = re.compile(r'^objectid:\s*?(.+)$', flags=re.M)
+intrangeregex = re.compile(r'^(\d+)\s*?-\s*?(\d+)$', flags=re.M)
+floatrangeregex = re.compile(r'^([0-9.]+)\s*?-\s*?([0-9.]+)$', flags=re.M)
+
+
+def classify_regexes(source):
+    """
+    Classification as done before the single-pass classifier.
+    """
+    if objectidregex.match(source):
+        return 'objectid', objectidregex.match(source).group(1)
+    elif intrangeregex.match(source):
+        return 'integer', tuple(int(i) for i in intrangeregex.match(source).group(1, 2))
+    elif floatrangeregex.match(source):
+        return 'float', tuple(float(i) for i in floatrangeregex.match(source).group(1, 2))
+    return 'string', None
+
+
+def string_values(count, distinct, seed=0):
+    """
+    Build a list of string values where a third are special strings, drawn
+    from a pool of distinct values the way real data repeats itself.
+    """
+    rng = random.Random(seed)
+    pool = []
+    for i in range(distinct):
+        kind = i % 6
+        if kind == 0:
+            pool.append('objectid:resource{}'.format(i))
+        elif kind == 1:
+            pool.append('{}-{}'.format(i, i * 10))
+        elif kind == 2:
+            pool.append('0.{}-1.{}'.format(i, i))
+        else:
+            pool.append('plain value number {}'.format(i))
+    return [rng.choice(pool) for _ in range(count)]
+
+
+def main(count=100000, repeat=5):
+    for distinct in (60, 6000, count):
+        values = string_values(count, distinct)
+        old = min(timeit.repeat(lambda: [classify_regexes(v) for v in values], number=1, repeat=repeat))
+        _classify_special.cache_clear()
+        new = min(timeit.repeat(lambda: [classify_string(v) for v in values], number=1, repeat=repeat))
+        print('{:>7} distinct: regexes {:7.1f} ns/node, classifier {:7.1f} ns/node, {:4.1f}x'.format(
+            distinct, old / count * 1e9, new / count * 1e9, old / new))
+
+
+if __name__ == '__main__':
+    main()
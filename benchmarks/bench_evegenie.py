@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for EveGenie over synthetic inputs.
+
+Times EveGenie.__init__, format_endpoint and write_file separately for each
+synthetic input, measures peak memory of each phase with tracemalloc and
+writes the results as JSON so runs of different revisions can be compared:
+
+    python benchmarks/bench_evegenie.py -o before.json
+    python benchmarks/bench_evegenie.py -o after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from evegenie import EveGenie
+from synthetic import GENERATORS
+
+
+def revision():
+    """
+    :return: git revision of the tree being benchmarked, if known
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=parent_dir,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def phases(data, outfile):
+    """
+    The benchmarked phases, each a function of the previous phase's result.
+    """
+    def init(_):
+        return EveGenie(data=data)
+
+    def format_endpoint(eg):
+        for schema in eg.endpoints.values():
+            eg.format_endpoint(schema)
+        return eg
+
+    def write_file(eg):
+        eg.write_file(outfile)
+        return eg
+
+    return [('init', init), ('format_endpoint', format_endpoint), ('write_file', write_file)]
+
+
+def measure(data, repeat):
+    """
+    Run each phase repeat times, keeping the fastest time, then once more
+    under tracemalloc for its peak memory.
+
+    :param data: synthetic input
+    :param repeat: number of timed runs
+    :return: dict of seconds and peak bytes per phase
+    """
+    results = OrderedDict()
+    with tempfile.TemporaryDirectory() as tmp:
+        outfile = os.path.join(tmp, 'settings.py')
+        for _ in range(repeat):
+            value = None
+            for name, phase in phases(data, outfile):
+                start = time.perf_counter()
+                value = phase(value)
+                seconds = time.perf_counter() - start
+                results.setdefault(name, OrderedDict([('seconds', seconds)]))
+                results[name]['seconds'] = min(results[name]['seconds'], seconds)
+
+        value = None
+        for name, phase in phases(data, outfile):
+            tracemalloc.start()
+            value = phase(value)
+            results[name]['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return results
+
+
+def compare(results, baseline):
+    """
+    Print the ratio of each phase's time and memory to a baseline run.
+    """
+    print('\ncompared to {}'.format(baseline.get('revision')))
+    for case, case_results in results['cases'].items():
+        for phase, result in case_results.items():
+            old = baseline['cases'].get(case, {}).get(phase)
+            if not old:
+                continue
+            print('{:<16} {:<16} time {:6.2f}x  memory {:6.2f}x'.format(
+                case, phase, result['seconds'] / old['seconds'],
+                result['peak_bytes'] / float(max(old['peak_bytes'], 1))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark EveGenie over synthetic inputs.')
+    parser.add_argument('-o', '--output', default=None, help='write results as JSON to this file')
+    parser.add_argument('--compare', default=None, help='JSON results of a previous run to compare with')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the size of every input')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs per phase')
+    parser.add_argument('cases', nargs='*', default=list(GENERATORS), help='inputs to run')
+    args = parser.parse_args()
+
+    results = OrderedDict([
+        ('revision', revision()),
+        ('python', platform.python_version()),
+        ('scale', args.scale),
+        ('cases', OrderedDict()),
+    ])
+    for case in args.cases:
+        generator, size = GENERATORS[case]
+        size = max(1, int(size * args.scale))
+        results['cases'][case] = measure(generator(size), args.repeat)
+        for phase, result in results['cases'][case].items():
+            print('{:<16} {:<16} {:9.4f}s {:9.1f} KiB'.format(
+                case, phase, result['seconds'], result['peak_bytes'] / 1024.0))
+
+    if args.output:
+        with open(args.output, 'w') as ofile:
+            json.dump(results, ofile, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as ifile:
+            compare(results, json.load(ifile))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Benchmark string format detection on string-heavy records.
+
+Times detect_format against matching every format's regex in turn, on
+strings in each format and on plain text, then folds records with and
+without formats to show what detection adds to parsing them:
+
+    python benchmarks/bench_formats.py
+    python benchmarks/bench_formats.py --records 200000
+"""
+
+import argparse
+import os
+import re
+import sys
+import timeit
+from collections import OrderedDict
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from evegenie import EveGenie
+from evegenie.formats import FORMAT_REGEXES, StringFormats, detect_format, _ISO_DATETIME, _RFC1123_DATETIME
+
+
+NAIVE = [
+    ('objectid', re.compile(r'[0-9a-fA-F]{24}$')),
+    ('uuid', re.compile(FORMAT_REGEXES['uuid'] + '$')),
+    ('iso8601', _ISO_DATETIME),
+    ('datetime', _RFC1123_DATETIME),
+    ('url', re.compile(FORMAT_REGEXES['url'] + '$')),
+    ('email', re.compile(FORMAT_REGEXES['email'] + '$')),
+]
+
+
+def detect_naive(value):
+    """
+    Detection without the prefilter, trying every regex in turn and not
+    checking days against the length of their month.
+    """
+    for name, regex in NAIVE:
+        if regex.match(value):
+            return name
+    return None
+
+
+def string_records(size):
+    """
+    Records of one endpoint with a field per format and as many fields of
+    plain text.
+
+    :param size: number of records
+    """
+    return [OrderedDict([
+        ('created', '2020-01-{:02d}T10:{:02d}:00Z'.format(i % 28 + 1, i % 60)),
+        ('owner', '{:024x}'.format(i * 7919)),
+        ('key', '123e4567-e89b-12d3-a456-{:012x}'.format(i)),
+        ('email', 'user{}@example.com'.format(i)),
+        ('homepage', 'https://example.com/users/{}'.format(i)),
+        ('name', 'User number {}'.format(i)),
+        ('title', 'Some title of record {}'.format(i % 97)),
+        ('city', ['Berlin', 'Lisbon', 'Osaka', 'Quito'][i % 4]),
+        ('bio', 'Writes about things, number {} of many, mostly on weekends.'.format(i)),
+        ('status', 'active' if i % 3 else 'inactive'),
+    ]) for i in range(size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark string format detection.')
+    parser.add_argument('--records', type=int, default=50000, help='number of records folded')
+    parser.add_argument('--repeat', type=int, default=3, help='timings to take the best of')
+    args = parser.parse_args()
+
+    documents = string_records(args.records)
+    columns = OrderedDict((k, [d[k] for d in documents]) for k in documents[0])
+    print('{:<12}{:>14}{:>18}'.format('field', 'naive ns/str', 'prefilter ns/str'))
+    for name, values in columns.items():
+        assert list(map(detect_format, values)) == list(map(detect_naive, values)), name
+        naive = min(timeit.repeat(lambda: list(map(detect_naive, values)), number=1, repeat=args.repeat))
+        fast = min(timeit.repeat(lambda: list(map(detect_format, values)), number=1, repeat=args.repeat))
+        print('{:<12}{:>14.1f}{:>18.1f}{:>7.1f}x'.format(
+            name, naive / len(values) * 1e9, fast / len(values) * 1e9, naive / fast))
+
+    def fold(formats):
+        return EveGenie(records={'records': iter(documents)}, formats=formats)
+
+    plain = min(timeit.repeat(lambda: fold(None), number=1, repeat=args.repeat))
+    print('{} records, {} strings each'.format(len(documents), len(documents[0])))
+    print('{:<24}{:>10}{:>14}'.format('folding', 'seconds', 'records/s'))
+    print('{:<24}{:>10.3f}{:>14.0f}'.format('without formats', plain, len(documents) / plain))
+    for label, sample_size in (('formats, sampled', 1000), ('formats, all strings', len(documents))):
+        seconds = min(timeit.repeat(lambda: fold(StringFormats(sample_size=sample_size)), number=1,
+                                    repeat=args.repeat))
+        print('{:<24}{:>10.3f}{:>14.0f}'.format(label, seconds, len(documents) / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Benchmark loading generated settings the way Eve does at startup.
+
+Writes settings for each synthetic input once with DOMAIN as Python literals
+and once per sidecar format, then times compiling and running the settings
+file and reading DOMAIN from it, like Flask's Config.from_pyfile. Then checks
+that converting a small file with geneve.py stays within a cold start
+budget, exiting with status 1 when it doesn't:
+
+    python benchmarks/bench_settings_import.py
+    python benchmarks/bench_settings_import.py many_endpoints --share-shapes
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from collections import OrderedDict
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from evegenie import EveGenie
+from evegenie.evegenie import SIDECAR_FORMATS
+from synthetic import GENERATORS
+
+
+# deep nesting is beyond what the Python compiler accepts as a literal
+CASES = [case for case in GENERATORS if case != 'deep']
+# seconds geneve.py may take to convert a small file, beyond starting python
+COLD_START_BUDGET = 0.5
+
+
+def load_settings(filename):
+    """
+    Load a settings file like Config.from_pyfile and read its DOMAIN.
+
+    :param filename: settings filename
+    :return: DOMAIN
+    """
+    module = types.ModuleType('config')
+    module.__file__ = filename
+    with open(filename, 'rb') as ifile:
+        exec(compile(ifile.read(), filename, 'exec'), module.__dict__)
+    return module.DOMAIN
+
+
+def file_size(filename, sidecar):
+    """
+    :return: bytes of the settings file plus its sidecar
+    """
+    size = os.path.getsize(filename)
+    for name in os.listdir(os.path.dirname(filename)):
+        if sidecar and name.endswith('.domain-' + sidecar):
+            size += os.path.getsize(os.path.join(os.path.dirname(filename), name))
+    return size
+
+
+def measure(data, repeat, share_shapes=False):
+    """
+    :param data: synthetic input
+    :param repeat: number of timed loads, the fastest is kept
+    :param share_shapes: write repeated shapes once in the literal form
+    :return: dict of seconds and bytes per form
+    """
+    results = OrderedDict()
+    for sidecar in (None,) + SIDECAR_FORMATS:
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'settings.py')
+            EveGenie(data=data, sidecar=sidecar, share_shapes=share_shapes).write_file(filename)
+            seconds = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                load_settings(filename)
+                elapsed = time.perf_counter() - start
+                seconds = elapsed if seconds is None else min(seconds, elapsed)
+            results[sidecar or 'literal'] = OrderedDict([
+                ('seconds', seconds),
+                ('bytes', file_size(filename, sidecar)),
+            ])
+    return results
+
+
+def cold_start(repeat, template_cache=None):
+    """
+    Time converting a small file with geneve.py in a new process, less the
+    time python takes to start.
+
+    :param repeat: number of timed runs, the median is kept
+    :param template_cache: EVEGENIE_TEMPLATE_CACHE of the runs, or None
+    :return: seconds
+    """
+    env = dict(os.environ)
+    env.pop('EVEGENIE_TEMPLATE_CACHE', None)
+    if template_cache:
+        env['EVEGENIE_TEMPLATE_CACHE'] = template_cache
+
+    def median_run(args):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.check_call([sys.executable] + args, cwd=parent_dir, stdout=subprocess.DEVNULL, env=env)
+            times.append(time.perf_counter() - start)
+        return sorted(times)[len(times) // 2]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'small.json')
+        with open(filename, 'w') as ofile:
+            json.dump({'user': {'name': 'Bob', 'age': 42}}, ofile)
+        return median_run(['geneve.py', filename]) - median_run(['-c', 'pass'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark loading generated settings.')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the size of every input')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed loads per form')
+    parser.add_argument('--share-shapes', action='store_true', help='share repeated shapes in the literal form')
+    parser.add_argument('cases', nargs='*', default=CASES, help='inputs to run')
+    args = parser.parse_args()
+
+    for case in args.cases:
+        generator, size = GENERATORS[case]
+        results = measure(generator(max(1, int(size * args.scale))), args.repeat, args.share_shapes)
+        literal = results['literal']['seconds']
+        for form, result in results.items():
+            print('{:<16} {:<8} {:9.4f}s {:6.2f}x {:11d} bytes'.format(
+                case, form, result['seconds'], literal / result['seconds'], result['bytes']))
+
+    over = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, template_cache in (('cold start', None), ('template cache', tmp)):
+            seconds = cold_start(max(3, args.repeat), template_cache)
+            over = over or seconds > COLD_START_BUDGET
+            print('{:<25} {:9.4f}s, budget {:.2f}s'.format(label, seconds, COLD_START_BUDGET))
+    if over:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Benchmark validators compiled from inferred schemas against Eve's Cerberus
+Validator.
+
+Infers a schema from the valid synthetic records, then validates all of
+them, some invalid, with Cerberus, with the compiled validator and with
+validate_many over a process pool, checking all three report the same
+errors:
+
+    python benchmarks/bench_validate.py
+    python benchmarks/bench_validate.py --records 1000000 -j 4
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from eve.io.mongo import Validator
+
+from evegenie import EveGenie
+from evegenie.validate import compile_validator, validate_many
+from synthetic import records
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark compiled validators against Cerberus.')
+    parser.add_argument('--records', type=int, default=100000, help='number of records validated')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes of validate_many')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='records per validate_many chunk')
+    args = parser.parse_args()
+
+    documents = records(args.records)
+    eg = EveGenie(records={'records': iter(d for i, d in enumerate(documents) if i % 10 != 9)}, presence=True)
+    schema = OrderedDict(eg)['records']['schema']
+    validator = Validator(schema)
+
+    def cerberus():
+        errors = []
+        for i, document in enumerate(documents):
+            if not validator.validate(document):
+                errors.append((i, validator.errors))
+        return errors
+
+    def compiled():
+        validate = compile_validator(schema)
+        return [(i, e) for i, e in enumerate(map(validate, documents)) if e]
+
+    cerberus_seconds, expected = timed(cerberus)
+    compile_seconds, _ = timed(lambda: compile_validator(schema))
+    compiled_seconds, errors = timed(compiled)
+    pool_seconds, pool_errors = timed(lambda: list(validate_many(schema, documents, workers=args.jobs,
+                                                                 chunk_size=args.chunk_size)))
+    assert errors == expected, 'compiled validator errors differ from Cerberus'
+    assert pool_errors == expected, 'validate_many errors differ from Cerberus'
+
+    print('{} records, {} invalid'.format(len(documents), len(expected)))
+    print('{:<16}{:>10}{:>14}'.format('validator', 'seconds', 'records/s'))
+    for name, seconds in (('cerberus', cerberus_seconds), ('compiled', compiled_seconds),
+                          ('validate_many', pool_seconds)):
+        print('{:<16}{:>10.3f}{:>14.0f}'.format(name, seconds, len(documents) / seconds))
+    print('compiling the schema took {:.2f}ms'.format(compile_seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
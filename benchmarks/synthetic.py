@@ -0,0 +1,128 @@
+"""
+Synthetic EveGenie inputs for benchmarks.
+
+Each generator returns an OrderedDict of endpoints ready to pass to EveGenie
+as data, and is deterministic for a given size.
+"""
+
+from collections import OrderedDict
+
+
+def _record(i):
+    return OrderedDict([
+        ('name', 'name {}'.format(i)),
+        ('count', i),
+        ('ratio', i / 7.0),
+        ('active', i % 2 == 0),
+        ('tags', ['a', 'b', 'c']),
+        ('address', OrderedDict([
+            ('street', '{} Main St'.format(i)),
+            ('city', 'Springfield'),
+        ])),
+    ])
+
+
+def many_endpoints(size):
+    """
+    Many small, independent endpoints.
+
+    :param size: number of endpoints
+    """
+    return OrderedDict([('resource-{}'.format(i), _record(i)) for i in range(size)])
+
+
+def wide(size):
+    """
+    One endpoint with a very wide object of mixed fields.
+
+    :param size: number of fields
+    """
+    fields = OrderedDict()
+    for i in range(size):
+        kind = i % 4
+        if kind == 0:
+            fields['field{}'.format(i)] = 'value {}'.format(i)
+        elif kind == 1:
+            fields['field{}'.format(i)] = i
+        elif kind == 2:
+            fields['field{}'.format(i)] = float(i)
+        else:
+            fields['field{}'.format(i)] = None
+    return OrderedDict([('wide', fields)])
+
+
+def deep(size):
+    """
+    One endpoint nested size levels deep, each level also holding a list
+    and a scalar.
+
+    :param size: nesting depth
+    """
+    node = OrderedDict([('leaf', 'bottom')])
+    for i in range(size):
+        node = OrderedDict([('level', i), ('items', [i]), ('child', node)])
+    return OrderedDict([('deep', node)])
+
+
+def long_list(size):
+    """
+    One endpoint holding a huge list of records.
+
+    :param size: number of list items
+    """
+    return OrderedDict([('long', OrderedDict([('items', [_record(i) for i in range(size)])]))])
+
+
+def special_strings(size):
+    """
+    One endpoint made of evegenie special strings and plain strings,
+    repeating values the way real data does.
+
+    :param size: number of fields
+    """
+    fields = OrderedDict()
+    for i in range(size):
+        kind = i % 4
+        if kind == 0:
+            value = 'objectid:resource-{}'.format(i % 50)
+        elif kind == 1:
+            value = '{}-{}'.format(i % 10, 100)
+        elif kind == 2:
+            value = '0.{}-1.0'.format(i % 10)
+        else:
+            value = 'plain string {}'.format(i % 100)
+        fields['field{}'.format(i)] = [value, value]
+    return OrderedDict([('special', fields)])
+
+
+def records(size):
+    """
+    Records of one endpoint, every tenth one breaking the schema of the
+    others in a different way.
+
+    :param size: number of records
+    """
+    result = []
+    for i in range(size):
+        record = _record(i)
+        if i % 10 == 9:
+            kind = i // 10 % 4
+            if kind == 0:
+                record['count'] = str(i)
+            elif kind == 1:
+                del record['name']
+            elif kind == 2:
+                record['tags'].append(i)
+            else:
+                record['address']['zip'] = i
+        result.append(record)
+    return result
+
+
+GENERATORS = OrderedDict([
+    ('many_endpoints', (many_endpoints, 2000)),
+    ('wide', (wide, 50000)),
+    ('deep', (deep, 300)),
+    ('long_list', (long_list, 50000)),
+    ('special_strings', (special_strings, 50000)),
+])
@@ -0,0 +1,95 @@
+"""
+On-disk cache of parsed and formatted endpoint schemas.
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+
+# bump when inference or formatting changes so stale entries are ignored
+CACHE_VERSION = 2
+
+
+def source_key(source, options):
+    """
+    Hash an endpoint's source json. Key order is part of the hash since
+    it decides the order of fields in the output.
+
+    :param source: dict of fields in an endpoint
+    :param options: dict of options affecting the parsed schema
+    :return: hex digest identifying the endpoint's schema
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([CACHE_VERSION, options], sort_keys=True).encode('utf-8'))
+    digest.update(json.dumps(source, separators=(',', ':')).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class SchemaCache(object):
+    """
+    Stores each endpoint's eve schema and formatted text under a hash of
+    its source json and the options it was parsed with, so unchanged
+    endpoints don't need to be parsed or formatted again.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: directory holding cache entries, created if missing
+        """
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, source, options):
+        """
+        :param source: dict of fields in an endpoint
+        :param options: dict of options affecting the parsed schema
+        :return: hex digest identifying the endpoint's schema, see source_key
+        """
+        return source_key(source, options)
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, key):
+        """
+        Look up a cache entry, counting the hit or miss.
+
+        :param key: key from SchemaCache.key
+        :return: tuple of schema and formatted text, or None on a miss
+        """
+        try:
+            with open(self.path(key), 'r') as ifile:
+                entry = json.load(ifile, object_pairs_hook=OrderedDict)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['schema'], entry['text']
+
+    def put(self, key, schema, text):
+        """
+        Store a cache entry. The entry is written to a temporary file first
+        so concurrent runs never read a partial entry.
+
+        :param key: key from SchemaCache.key
+        :param schema: dict representing eve schema for the endpoint
+        :param text: formatted endpoint schema
+        :return:
+        """
+        import tempfile
+
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as ofile:
+            json.dump(OrderedDict([('schema', schema), ('text', text)]), ofile)
+        os.replace(tmp, path)
+
+    def report(self):
+        """
+        :return: summary of cache hits and misses
+        """
+        return 'cache: {} hits, {} misses'.format(self.hits, self.misses)
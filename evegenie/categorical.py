@@ -0,0 +1,121 @@
+"""
+Detection of categorical string fields in the records of an endpoint.
+"""
+from collections import OrderedDict
+
+
+class FieldValues(object):
+    """
+    Distinct string values of a field, kept exactly up to a cap. A field
+    past the cap can't be categorical, so its values are dropped and no
+    longer counted, which keeps memory and work per field bounded.
+    """
+
+    __slots__ = ('count', 'values')
+
+    def __init__(self):
+        self.count = 0
+        # set of the distinct values, None once there were too many
+        self.values = set()
+
+    @property
+    def overflowed(self):
+        return self.values is None
+
+
+class EndpointValues(object):
+    """
+    Distinct string values of the records of one endpoint, keyed by the
+    path of each field.
+    """
+
+    # types of the values counted, see RecordWalker
+    value_types = (str,)
+
+    def __init__(self, max_values):
+        """
+        :param max_values: distinct values kept per field
+        """
+        self.max_values = max_values
+        # path of a field -> FieldValues
+        self.fields = {}
+
+    def add(self, path, value):
+        """
+        Count one value of a field when it is a string, see RecordWalker.
+
+        :param path: path of the field, empty for the record itself
+        :param value: value of the field
+        :return:
+        """
+        if not isinstance(value, str):
+            return
+        counters = self.fields.get(path)
+        if counters is None:
+            counters = self.fields[path] = FieldValues()
+        elif counters.values is None:
+            return
+        counters.count += 1
+        counters.values.add(value)
+        if len(counters.values) > self.max_values:
+            counters.values = None
+
+    def flush(self):
+        """
+        Nothing is buffered, values are counted as they are added.
+        """
+
+
+class CategoricalFields(object):
+    """
+    Finds string fields of records taking few distinct values and sets
+    their allowed rule. A field is categorical when it has:
+
+    - at least `min_count` string values
+    - at most `max_values` distinct values
+    - at most `max_ratio` distinct values per value, so values repeat
+    """
+
+    def __init__(self, max_values=20, max_ratio=0.5, min_count=10):
+        """
+        :param max_values: most distinct values of a categorical field, and
+            the number of values kept per field
+        :param max_ratio: highest share of distinct values among the values
+        :param min_count: fewest values a field needs to be categorical
+        """
+        self.max_values = max_values
+        self.max_ratio = max_ratio
+        self.min_count = min_count
+        # endpoint name -> EndpointValues
+        self.endpoints = OrderedDict()
+
+    def endpoint(self, name):
+        """
+        :param name: endpoint name
+        :return: new EndpointValues collecting the values of the endpoint
+        """
+        values = self.endpoints[name] = EndpointValues(self.max_values)
+        return values
+
+    def is_categorical(self, counters):
+        """
+        :param counters: FieldValues of a field
+        :return: whether the field is categorical
+        """
+        return (not counters.overflowed and counters.count >= self.min_count
+                and len(counters.values) <= self.max_ratio * counters.count)
+
+    def apply(self, values, path, node):
+        """
+        Set the allowed rule of a field of a folded schema when it is a
+        categorical string field, see walk_schema.
+
+        :param values: EndpointValues of the endpoint's records
+        :param path: path of the field
+        :param node: SchemaNode of the field, updated in place
+        :return:
+        """
+        if node.type == 'string':
+            counters = values.fields.get(path)
+            if counters is not None and self.is_categorical(counters):
+                node.allowed = sorted(counters.values)
@@ -0,0 +1,56 @@
+"""
+Classification of evegenie special strings.
+"""
+import re
+from functools import lru_cache
+
+
+# 'objectid:sample-endpoint' or 'objectid: sample-endpoint'
+# 'int-int' or 'int - int'. eg: '1-10'
+# 'float-float' or 'float - float'. eg: 0.0-1.0
+# alternatives are tried in that order, so an int range is never a float range
+specialregex = re.compile(
+    r'^(?:objectid:\s*(?P<resource>.+)'
+    r'|(?P<imin>\d+)\s*-\s*(?P<imax>\d+)'
+    r'|(?P<fmin>[0-9.]+)\s*-\s*(?P<fmax>[0-9.]+))$',
+    flags=re.M
+)
+
+CACHE_SIZE = 4096
+
+
+def classify_string(source):
+    """
+    Classify a string from source json in a single pass, returning its eve
+    type and the data parsed from it: the related resource for objectids and
+    (min, max) for ranges.
+
+    :param source: string value from source json field
+    :return: tuple of eve schema type and parsed payload, or None payload
+    """
+    # every special string starts with 'o', a digit or '.', so most plain
+    # strings are rejected without running the regex or touching the cache
+    if not source:
+        return 'string', None
+    first = source[0]
+    if first != 'o' and first != '.' and not first.isdecimal():
+        return 'string', None
+    return _classify_special(source)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _classify_special(source):
+    match = specialregex.match(source)
+    if match is None:
+        return 'string', None
+
+    groups = match.groupdict()
+    if groups['resource'] is not None:
+        return 'objectid', groups['resource'].strip() or None
+    if groups['imin'] is not None:
+        return 'integer', (int(groups['imin']), int(groups['imax']))
+    try:
+        return 'float', (float(groups['fmin']), float(groups['fmax']))
+    except ValueError:
+        # eg: '1.2.3-4', looks like a range but isn't one
+        return 'string', None
@@ -0,0 +1,195 @@
+"""
+Structural diff of the schemas of two EveGenie instances.
+"""
+import hashlib
+from collections import OrderedDict
+
+from .node import SchemaNode
+
+
+class SchemaHashes(object):
+    """
+    Merkle hashes of SchemaNodes, where a node's hash covers its rules and
+    the hashes of its nested schemas. Hashes are kept by node, and nodes
+    are read-only once their endpoint is parsed, so each distinct subtree
+    is hashed once however often it is compared. Field order is ignored.
+    """
+
+    def __init__(self):
+        # id of a node -> (node, digest), holding the node keeps its id valid
+        self.digests = {}
+
+    def __len__(self):
+        return len(self.digests)
+
+    def digest(self, node):
+        """
+        Hash a node, hashing its nested schemas first with an explicit
+        stack, so any depth of nesting can be hashed.
+
+        :param node: SchemaNode
+        :return: digest bytes of the subtree
+        """
+        digests = self.digests
+        if id(node) in digests:
+            return digests[id(node)][1]
+
+        stack = [(node, False)]
+        while stack:
+            current, ready = stack.pop()
+            if id(current) in digests:
+                continue
+            schema = current.schema
+            if isinstance(schema, SchemaNode):
+                children = [schema]
+            elif schema:
+                children = list(schema.values())
+            else:
+                children = []
+            if not ready and any(id(child) not in digests for child in children):
+                stack.append((current, True))
+                stack.extend((child, False) for child in children if id(child) not in digests)
+                continue
+
+            hasher = hashlib.blake2b(digest_size=16)
+            hasher.update(repr([(k, type(v).__name__, v) for k, v in current.items() if k != 'schema']).encode('utf-8'))
+            if isinstance(schema, SchemaNode):
+                hasher.update(b'[]' + digests[id(schema)][1])
+            elif schema:
+                for k in sorted(schema):
+                    hasher.update(repr(k).encode('utf-8') + digests[id(schema[k])][1])
+            digests[id(current)] = (current, hasher.digest())
+        return digests[id(node)][1]
+
+
+class SchemaDiff(object):
+    """
+    Differences between the endpoints of two EveGenie instances. Field
+    changes of each endpoint are listed by dotted path, where list items
+    are written as path[].
+    """
+
+    def __init__(self):
+        self.added_endpoints = []
+        self.removed_endpoints = []
+        # endpoint -> OrderedDict of added, removed, retyped and changed lists
+        self.endpoints = OrderedDict()
+
+    def __bool__(self):
+        return bool(self.added_endpoints or self.removed_endpoints or self.endpoints)
+
+    def changes(self, endpoint):
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = OrderedDict([
+                # (path, type)
+                ('added', []),
+                ('removed', []),
+                # (path, old type, new type)
+                ('retyped', []),
+                # (path, rule, old value, new value) of other rules
+                ('changed', []),
+            ])
+        return self.endpoints[endpoint]
+
+    def as_dict(self):
+        """
+        :return: the diff as plain dicts and lists, ready for json
+        """
+        return OrderedDict([
+            ('added_endpoints', self.added_endpoints),
+            ('removed_endpoints', self.removed_endpoints),
+            ('endpoints', OrderedDict(
+                (name, OrderedDict((kind, [list(change) for change in changes]) for kind, changes in endpoint.items()))
+                for name, endpoint in self.endpoints.items())),
+        ])
+
+    def report(self):
+        """
+        :return: human readable summary of the diff
+        """
+        lines = []
+        for name in self.added_endpoints:
+            lines.append('+ endpoint {}'.format(name))
+        for name in self.removed_endpoints:
+            lines.append('- endpoint {}'.format(name))
+        for name, changes in self.endpoints.items():
+            lines.append('endpoint {}'.format(name))
+            for path, eve_type in changes['added']:
+                lines.append('  + {} ({})'.format(path, eve_type))
+            for path, eve_type in changes['removed']:
+                lines.append('  - {} ({})'.format(path, eve_type))
+            for path, old, new in changes['retyped']:
+                lines.append('  ~ {} {} -> {}'.format(path, old, new))
+            for path, rule, old, new in changes['changed']:
+                lines.append('  ~ {} {}: {!r} -> {!r}'.format(path, rule, old, new))
+        return '\n'.join(lines) if lines else 'no differences'
+
+
+def _rules(node):
+    return OrderedDict((k, v) for k, v in node.items() if k not in ('type', 'schema'))
+
+
+def _path(parent, key):
+    return key if not parent else '{}.{}'.format(parent, key)
+
+
+def diff(old, new):
+    """
+    Compare the endpoints of two EveGenie instances. Subtrees whose Merkle
+    hashes match are skipped without being walked, so the cost grows with
+    the size of the change rather than the size of the schemas.
+
+    :param old: EveGenie of the previous schemas
+    :param new: EveGenie of the new schemas
+    :return: SchemaDiff
+    """
+    result = SchemaDiff()
+    result.added_endpoints = [name for name in new.endpoints if name not in old.endpoints]
+    result.removed_endpoints = [name for name in old.endpoints if name not in new.endpoints]
+
+    for name in new.endpoints:
+        if name not in old.endpoints:
+            continue
+        a, b = old.endpoints[name], new.endpoints[name]
+        if a is b or old.hashes.digest(a) == new.hashes.digest(b):
+            continue
+
+        changes = result.changes(name)
+        # (path, old fields, new fields) of dicts to compare
+        stack = [('', a.schema or {}, b.schema or {})]
+        while stack:
+            path, fields, other = stack.pop()
+            for k, node in fields.items():
+                if k not in other:
+                    changes['removed'].append((_path(path, k), node.type))
+            for k, node in other.items():
+                field = _path(path, k)
+                if k not in fields:
+                    changes['added'].append((field, node.type))
+                    continue
+                before = fields[k]
+                # descend through list items until the nodes differ
+                while True:
+                    if before is node or old.hashes.digest(before) == new.hashes.digest(node):
+                        break
+                    if before.type != node.type:
+                        changes['retyped'].append((field, before.type, node.type))
+                        break
+                    rules, other_rules = _rules(before), _rules(node)
+                    for rule in list(rules) + [r for r in other_rules if r not in rules]:
+                        if rules.get(rule) != other_rules.get(rule):
+                            changes['changed'].append((field, rule, rules.get(rule), other_rules.get(rule)))
+                    if isinstance(before.schema, SchemaNode) and isinstance(node.schema, SchemaNode):
+                        before, node, field = before.schema, node.schema, field + '[]'
+                        continue
+                    # a list whose items were only seen on one side
+                    if isinstance(node.schema, SchemaNode):
+                        changes['added'].append((field + '[]', node.schema.type))
+                    elif isinstance(before.schema, SchemaNode):
+                        changes['removed'].append((field + '[]', before.schema.type))
+                    elif before.schema or node.schema:
+                        stack.append((field, before.schema or {}, node.schema or {}))
+                    break
+        for kind in changes.values():
+            kind.sort(key=lambda change: change[0])
+    return result
@@ -0,0 +1,110 @@
+"""
+Writer for eve schemas as Python literals.
+"""
+import math
+
+from .node import SchemaNode
+
+
+def write_literal(value, ofile, indent=4, level=0, refs=None):
+    """
+    Write a schema value to a text stream as a Python literal, laid out one
+    key or item per line like json.dumps with indentation. Strings are
+    escaped with ascii() so the output is valid Python in any encoding.
+    Nested values are walked with an explicit stack, so any depth of
+    nesting can be written.
+
+    :param value: schema value made of SchemaNodes, dicts, lists, strings,
+        numbers, bools and None
+    :param ofile: text stream to write to
+    :param indent: number of spaces per nesting level
+    :param level: nesting level of value
+    :param refs: dict mapping id() of nested SchemaNodes to the name of a
+        variable holding them, written instead of the node
+    :return:
+    """
+    write = ofile.write
+    if isinstance(value, SchemaNode):
+        value = _NodeItems(value)
+    if not (isinstance(value, _CONTAINERS) and value):
+        write(_scalar(value))
+        return
+
+    # (items iterator, is a dict, level, line prefix) of unfinished containers
+    stack = []
+    while True:
+        # value is a non-empty container, or the items of a SchemaNode
+        is_dict = not isinstance(value, (list, tuple))
+        items = iter(value.items()) if is_dict else iter(value)
+        prefix = '\n' + ' ' * (indent * (level + 1))
+        write('{' if is_dict else '[')
+        separator = prefix
+        while True:
+            for i in items:
+                write(separator)
+                separator = ',' + prefix
+                if is_dict:
+                    k, i = i
+                    write(ascii(k) if isinstance(k, str) else repr(k))
+                    write(': ')
+                if isinstance(i, str):
+                    write(ascii(i))
+                    continue
+                if isinstance(i, SchemaNode):
+                    if refs and id(i) in refs:
+                        write(refs[id(i)])
+                        continue
+                    i = _NodeItems(i)
+                if isinstance(i, _CONTAINERS) and i:
+                    stack.append((items, is_dict, level, prefix))
+                    value = i
+                    level += 1
+                    break
+                else:
+                    write(_scalar(i))
+            else:
+                write('\n' + ' ' * (indent * level) + ('}' if is_dict else ']'))
+                if not stack:
+                    return
+                items, is_dict, level, prefix = stack.pop()
+                separator = ',' + prefix
+                continue
+            break
+
+
+def _scalar(value):
+    """
+    :param value: string, number, bool, None or empty container
+    :return: Python literal of value
+    """
+    if isinstance(value, str):
+        return ascii(value)
+    if isinstance(value, (dict, _NodeItems)):
+        return '{}'
+    if isinstance(value, (list, tuple)):
+        return '[]'
+    if isinstance(value, float) and not math.isfinite(value):
+        return 'float({!r})'.format(repr(value))
+    if value is None or isinstance(value, (bool, int, float)):
+        return repr(value)
+    raise TypeError('Cannot write {} as a schema literal'.format(type(value).__name__))
+
+
+class _NodeItems(object):
+    """
+    Rules of a SchemaNode, written like a dict.
+    """
+
+    __slots__ = ('rules',)
+
+    def __init__(self, node):
+        self.rules = node.items()
+
+    def __len__(self):
+        return len(self.rules)
+
+    def items(self):
+        return self.rules
+
+
+_CONTAINERS = (dict, list, tuple, _NodeItems)
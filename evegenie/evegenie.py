@@ -1,49 +1,423 @@
 """
 EveGenie class for building Eve settings and schemas.
 """
+import io
 import json
+import keyword
+import marshal
+import math
 import os.path
+import pickle
+import random
 import re
 #from types import NoneType
-from collections import OrderedDict
-
-from jinja2 import Environment, PackageLoader
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+from contextlib import nullcontext
+from datetime import datetime
+
+from .cache import SchemaCache, source_key
+from .categorical import CategoricalFields
+from .classify import classify_string
+from .diff import SchemaHashes
+from .emitter import write_literal
+from .fields import RecordWalker, walk_schema
+from .mongodump import Decimal128, ObjectId
+from .node import SchemaNode, ShapeTable, from_dict, shared_shapes, to_dict
+from .formats import StringFormats
+from .presence import FieldPresence
+from .ranges import NumericRanges
+from .stats import GenieStats, schema_depth
+from .stream import iter_endpoints
+
+
+LIST_STRATEGIES = ('first', 'stride', 'reservoir')
+# modules DOMAIN sidecars can be written with
+SIDECAR_FORMATS = ('marshal', 'pickle', 'json')
+# bytecode of compiled templates is kept here between runs when set
+TEMPLATE_CACHE_DIR = os.environ.get('EVEGENIE_TEMPLATE_CACHE') or None
+
+# smallest number random() returns other than 0.0
+RANDOM_EPSILON = 2.0 ** -53
+
+# work stack operations of EveGenie.parse_item
+_DICT, _LIST, _NEXT, _MERGE = range(4)
+
+# module level names of the settings template
+_TEMPLATE_NAMES = ('os', 'MONGO_URI', 'RESOURCE_METHODS', 'ITEM_METHODS', 'DOMAIN')
+
+
+def _scalar_item(eve_type, payload):
+    """
+    Build the eve schema of a value that isn't a dict or list.
+
+    :param eve_type: eve schema type of the value
+    :param payload: data parsed from evegenie special strings
+    :return: SchemaNode for field
+    """
+    if eve_type == 'null':
+        # if null, don't assume any type, just set nullable to true.
+        return SchemaNode(nullable=True)
+    if not payload:
+        return SchemaNode(eve_type)
+    if eve_type == 'objectid':
+        # add extra data_relation for objectid types
+        return SchemaNode(eve_type, resource=payload)
+    # if parsed from a string, it's really a range
+    return SchemaNode(eve_type, min=payload[0], max=payload[1])
+
+
+def _log_random(rng):
+    """
+    :param rng: random.Random
+    :return: log of a uniform number in (0, 1), as random() may return 0.0
+    """
+    return math.log(rng.random() or RANDOM_EPSILON)
+
+
+_template_env = None
+
+
+def settings_template():
+    """
+    Load the settings template, importing jinja2 and building its
+    environment on first use only, so parsing alone never pays for them.
+    When TEMPLATE_CACHE_DIR is set, compiled templates are kept in a
+    bytecode cache there, so later runs skip compiling them.
+
+    :return: jinja2 Template of the settings file
+    """
+    global _template_env
+    if _template_env is None:
+        from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+        bytecode_cache = None
+        if TEMPLATE_CACHE_DIR:
+            try:
+                os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+                if os.access(TEMPLATE_CACHE_DIR, os.W_OK):
+                    bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+            except OSError:
+                # an unwritable cache only costs compiling the template
+                pass
+        _template_env = Environment(loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), 'templates')),
+                                    bytecode_cache=bytecode_cache)
+    return _template_env.get_template('settings.py.j2')
 
 
 class EveGenie(object):
 
-    template_env = Environment(loader=PackageLoader('evegenie', 'templates'))
-    # 'objectid:sample-endpoint' or 'objectid: sample-endpoint'
-    objectidregex = re.compile('^objectid:\s*?(.+)$', flags=re.M)
-    # 'int-int' or 'int - int'. eg: '1-10'
-    intrangeregex = re.compile('^(\d+)\s*?-\s*?(\d+)$', flags=re.M)
-    # 'float-float' or 'float - float'. eg: 0.0-1.0
-    floatrangeregex = re.compile('^([0-9.]+)\s*?-\s*?([0-9.]+)$', flags=re.M)
-
-
-    def __init__(self, data=None, filename=None):
+    type_mapper = {
+        #unicode: 'string',
+        str: 'string',
+        bool: 'boolean',
+        int: 'integer',
+        float: 'float',
+        dict: 'dict',
+        list: 'list',
+        OrderedDict: 'dict',
+        type(None): 'null',
+        # BSON values read from mongodump files
+        ObjectId: 'objectid',
+        datetime: 'datetime',
+        Decimal128: 'decimal',
+        bytes: 'binary',
+    }
+
+
+    def __init__(self, data=None, filename=None, stream=False, records=None, workers=None,
+                 list_sample=None, list_strategy='first', cache_dir=None, stats=None,
+                 lazy=False, share_shapes=False, sidecar=None, presence=None, categorical=None, ranges=None,
+                 formats=None):
         """
         Initialize EveGenie object. Parses input and sets each endpoint from
         input as an attribute on the EveGenie object.
 
         :param data: string or dict of the json representation of our schema
         :param filename: file containing json representation of our schema
+        :param stream: read filename incrementally, parsing each endpoint as
+            soon as it is complete instead of loading the whole document
+        :param records: dict mapping each endpoint to an iterable of example
+            records, which are folded into a single schema per endpoint
+        :param workers: number of processes to parse endpoints with, endpoints
+            are parsed in this process when not set or when using records
+        :param list_sample: maximum number of items of a list to infer its
+            schema from, every item is used when not set
+        :param list_strategy: how list items are sampled, one of 'first',
+            'stride' or 'reservoir'
+        :param cache_dir: directory caching each endpoint's schema and
+            formatted text by a hash of its source, so only endpoints whose
+            source changed are parsed and formatted. Not used for records.
+        :param stats: True or a GenieStats instance to record time per phase
+            and node counts, depth and peak memory per endpoint
+        :param lazy: keep the source of each endpoint and only parse it the
+            first time it is accessed. Workers aren't used in lazy mode.
+            Not used with stream or records, whose sources would all have
+            to be read up front and kept.
+        :param share_shapes: write each nested schema repeated across the
+            settings file once, as a variable referenced by every copy
+        :param sidecar: write DOMAIN to a file of this format ('marshal',
+            'pickle' or 'json') next to the settings file, which then only
+            loads it when DOMAIN is first used. marshal files only load in
+            the Python version that wrote them.
+        :param presence: True or a FieldPresence instance to count how often
+            each field of the records is present, null or empty, and set
+            required, nullable and empty from the counts. Only used for
+            records.
+        :param categorical: True or a CategoricalFields instance to set
+            allowed on string fields of the records taking few distinct
+            values. Only used for records.
+        :param ranges: True or a NumericRanges instance to set min and max
+            on integer and float fields of the records from their numbers.
+            Only used for records.
+        :param formats: True or a StringFormats instance to make string
+            fields of the records holding RFC 1123 datetimes or objectids of
+            that type, and set regex on fields of uuids, emails, urls or ISO
+            8601 dates. Only used for records.
         :return:
         """
+        if list_strategy not in LIST_STRATEGIES:
+            raise ValueError('List strategy must be in [{0}]'.format(', '.join(LIST_STRATEGIES)))
+        if sidecar is not None and sidecar not in SIDECAR_FORMATS:
+            raise ValueError('Sidecar format must be in [{0}]'.format(', '.join(SIDECAR_FORMATS)))
+        if lazy and (stream or records is not None):
+            raise ValueError('Lazy parsing can\'t be combined with stream or records')
+
         self.endpoints = OrderedDict()
+        self.lazy = lazy
+        self.workers = workers
+        self.list_sample = list_sample
+        self.list_strategy = list_strategy
+        self.share_shapes = share_shapes
+        self.sidecar = sidecar
+        # equal sub-schemas of parsed endpoints share one node
+        self.shapes = ShapeTable()
+        # Merkle hashes of parsed nodes, filled by diffs
+        self.hashes = SchemaHashes()
+        self.cache = SchemaCache(cache_dir) if cache_dir else None
+        # formatted text of endpoints, filled from and for the cache
+        self.formatted = {}
+        # source hash of each endpoint, filled by refresh
+        self.digests = {}
+        # endpoint -> (SchemaNode, its settings as dicts), filled by lookups
+        self.converted = {}
+        self.stats = GenieStats() if stats is True else stats or None
+        self.presence = FieldPresence() if presence is True else presence or None
+        self.categorical = CategoricalFields() if categorical is True else categorical or None
+        self.ranges = NumericRanges() if ranges is True else ranges or None
+        self.formats = StringFormats() if formats is True else formats or None
+        if self.stats is not None:
+            self.classify = self.stats.classifier(self.classify)
+
+        if records is not None:
+            self.endpoints = self.load_endpoints(self.parse_record_endpoints, records.items())
+            return
 
         if filename and not data:
-            if os.path.isfile(filename):
+            if stream and os.path.isfile(filename):
                 with open(filename, 'r') as ifile:
-                    data = ifile.read().strip()
+                    self.endpoints = self.load_endpoints(self.parse_endpoints, self.timed('load', iter_endpoints(ifile)))
+                return
+            if os.path.isfile(filename):
+                with self.phase('load'):
+                    with open(filename, 'r') as ifile:
+                        data = ifile.read().strip()
 
         if not isinstance(data, (str, dict, OrderedDict)):
             raise TypeError('Input is not a string: {}'.format(data))
 
         if isinstance(data, str):
-            data = json.loads(data, object_pairs_hook=OrderedDict)
+            with self.phase('load'):
+                data = json.loads(data, object_pairs_hook=OrderedDict)
+        if not isinstance(data, dict):
+            raise TypeError('Input is not an object: {}'.format(type(data).__name__))
+
+        self.endpoints = self.load_endpoints(self.parse_endpoints, data.items())
+
+    def load_endpoints(self, parse, sources):
+        """
+        Parse endpoints now, or wrap their sources to be parsed on access in
+        lazy mode.
+
+        :param parse: function parsing (endpoint name, endpoint source) tuples
+        :param sources: iterable of (endpoint name, endpoint source) tuples
+        :return: dict of eve settings for each endpoint
+        """
+        if self.lazy:
+            return LazyEndpoints(parse, sources)
+        return parse(sources)
+
+    def parse_record_endpoints(self, sources):
+        """
+        Fold the records of each endpoint into its eve settings.
+
+        :param sources: iterable of (endpoint name, iterable of records) tuples
+        :return: dict of eve settings for each endpoint
+        """
+        endpoints = OrderedDict()
+        for k, v in sources:
+            presence = None
+            if self.presence is not None:
+                presence = self.presence.endpoint(k, self.type_mapper)
+            values = None
+            if self.categorical is not None:
+                values = self.categorical.endpoint(k)
+            numbers = None
+            if self.ranges is not None:
+                numbers = self.ranges.endpoint(k)
+            strings = None
+            if self.formats is not None:
+                strings = self.formats.endpoint(k)
+            with self.measure(k) as endpoint_stats:
+                schema = self.parse_records(self.timed('load', v), presence, values, numbers, strings)
+                schema = self.shapes.intern_fields(schema)
+            if endpoint_stats is not None:
+                endpoint_stats.max_depth = schema_depth(schema)
+            endpoints[k] = SchemaNode(schema=schema)
+        return endpoints
+
+    def parse_endpoints(self, sources):
+        """
+        Parse each endpoint's raw json into its eve settings. With workers set
+        endpoints are spread over a process pool, keeping only a few in
+        flight so streamed input stays bounded, and results keep input order.
+        Endpoints found in the cache are not parsed again.
+
+        :param sources: iterable of (endpoint name, endpoint source) tuples
+        :return: dict of eve settings for each endpoint
+        """
+        endpoints = OrderedDict()
+        pending = deque()
+        pool = None
+        if self.workers and self.workers > 1 and not self.lazy:
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(max_workers=self.workers)
+
+        def resolve(name, key, endpoint):
+            if pool is not None and not isinstance(endpoint, SchemaNode):
+                with self.phase('parse'):
+                    endpoint = SchemaNode(schema=self.shapes.intern_fields(endpoint.result()))
+            if key is not None:
+                self.formatted[name] = self.format_endpoint(endpoint)
+                self.cache.put(key, to_dict(endpoint), self.formatted[name])
+            endpoints[name] = endpoint
+
+        try:
+            for k, v in sources:
+                key = entry = None
+                if self.cache is not None:
+                    key = self.cache.key(v, self.options())
+                    entry = self.cache.get(key)
+
+                if entry is not None:
+                    self.formatted[k] = entry[1]
+                    endpoint = from_dict(entry[0])
+                    self.shapes.intern_fields(endpoint.schema)
+                    pending.append((k, None, endpoint))
+                elif pool is not None:
+                    pending.append((k, key, pool.submit(self.parse_endpoint, v)))
+                else:
+                    with self.measure(k) as endpoint_stats:
+                        schema = self.shapes.intern_fields(self.parse_endpoint(v))
+                    if endpoint_stats is not None:
+                        endpoint_stats.max_depth = schema_depth(schema)
+                    pending.append((k, key, SchemaNode(schema=schema)))
+
+                if pool is None or len(pending) > 2 * self.workers:
+                    resolve(*pending.popleft())
+            while pending:
+                resolve(*pending.popleft())
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return endpoints
+
+    def refresh(self, filename):
+        """
+        Read a json file again and parse only the endpoints whose source
+        changed since the last refresh, keeping the parsed schema and
+        formatted text of the others. Refreshing an empty EveGenie loads
+        every endpoint.
+
+        :param filename: file containing json representation of our schema
+        :return: list of names of endpoints added, changed or removed
+        """
+        with self.phase('load'):
+            with open(filename, 'r') as ifile:
+                data = json.load(ifile, object_pairs_hook=OrderedDict)
+        if not isinstance(data, dict):
+            raise TypeError('Input is not an object: {}'.format(filename))
+
+        options = self.options()
+        digests = OrderedDict((k, source_key(v, options)) for k, v in data.items())
+        changed = [k for k, digest in digests.items()
+                   if self.digests.get(k) != digest or k not in self.endpoints]
+        removed = [k for k in self.endpoints if k not in data]
+
+        for k in changed + removed:
+            self.formatted.pop(k, None)
+            self.converted.pop(k, None)
+        if changed or removed:
+            # a new table lets the nodes of replaced endpoints go, and the
+            # kept endpoints are interned again so new ones can share them
+            self.shapes = ShapeTable()
+            # hashes hold their nodes too, and are computed again on demand
+            self.hashes = SchemaHashes()
+            for k, endpoint in self.endpoints.items():
+                if k in data and k not in changed:
+                    self.shapes.intern_fields(endpoint.schema)
+        parsed = self.parse_endpoints((k, data[k]) for k in changed)
+        for k in changed:
+            if k not in self.formatted:
+                self.formatted[k] = self.format_endpoint(parsed[k])
+        self.endpoints = OrderedDict((k, parsed[k] if k in parsed else self.endpoints[k]) for k in data)
+        self.digests = digests
+        return changed + removed
+
+    def phase(self, name):
+        """
+        :param name: phase of the conversion, see GenieStats
+        :return: context manager timing the phase when stats are recorded
+        """
+        return self.stats.phase(name) if self.stats is not None else nullcontext()
 
-        self.endpoints = OrderedDict([(k, OrderedDict([('schema', self.parse_endpoint(v))])) for k, v in data.items()])
+    def measure(self, name):
+        """
+        :param name: endpoint name
+        :return: context manager measuring the parse of an endpoint when
+            stats are recorded, giving its EndpointStats or None
+        """
+        return self.stats.endpoint(name) if self.stats is not None else nullcontext()
+
+    def timed(self, name, iterable):
+        """
+        Time pulling each item from an iterable as a phase, such as input
+        that is read while it is being parsed.
+
+        :param name: phase of the conversion, see GenieStats
+        :param iterable: iterable to time
+        :return: generator of the iterable's items
+        """
+        if self.stats is None:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def options(self):
+        """
+        :return: dict of the options that affect parsed schemas
+        """
+        return OrderedDict([
+            ('list_sample', self.list_sample),
+            ('list_strategy', self.list_strategy),
+        ])
 
     def parse_endpoint(self, endpoint_source):
         """
@@ -51,64 +425,254 @@ class EveGenie(object):
         converts it to the eve schema equivalent.
 
         :param endpoint_source: dict of fields in an endpoint
-        :return: dict representing eve schema for the endpoint
+        :return: dict of SchemaNodes for each field of the endpoint
+        """
+        if not isinstance(endpoint_source, dict):
+            raise TypeError('Endpoint is not an object: {}'.format(type(endpoint_source).__name__))
+        return {k: self.parse_item(v) for k, v in endpoint_source.items()}
+
+    def parse_records(self, records, presence=None, values=None, numbers=None, strings=None):
+        """
+        Fold any number of example records of one endpoint into a single eve
+        schema. Records are consumed one at a time, so memory grows with the
+        number of distinct fields rather than the number of records. Each
+        record is walked once for all the analyzers given, and the folded
+        schema once for all their rules.
+
+        :param records: iterable of dicts, each one a record of the endpoint
+        :param presence: EndpointPresence counting the fields of the records,
+            whose counts then set required, nullable and empty
+        :param values: EndpointValues collecting the string values of the
+            records, which then set allowed on categorical fields
+        :param numbers: EndpointRanges collecting the numbers of the
+            records, which then set min and max
+        :param strings: EndpointFormats sampling the strings of the
+            records, which then set the type or regex of fields in a format
+        :return: dict of SchemaNodes for each field of the endpoint
+        """
+        # (analyzer, its collector of the records) in the order they set
+        # rules: formats go first, so fields retyped from string get no
+        # empty rule and no allowed strings
+        analyzers = [(analyzer, collector) for analyzer, collector in (
+            (self.formats, strings), (self.presence, presence), (self.categorical, values), (self.ranges, numbers))
+            if collector is not None]
+        walker = RecordWalker([collector for analyzer, collector in analyzers]) if analyzers else None
+
+        schema = {}
+        for record in records:
+            if walker is not None:
+                walker.walk(record)
+            schema = self.merge_schema(schema, self.parse_endpoint(record))
+        if analyzers:
+            for analyzer, collector in analyzers:
+                collector.flush()
+            for path, node in walk_schema(schema):
+                for analyzer, collector in analyzers:
+                    analyzer.apply(collector, path, node)
+        return schema
+
+    def merge_schema(self, schema, other):
         """
-        return OrderedDict([(k, self.parse_item(v)) for k, v in endpoint_source.items()])
+        Merge the field schemas of two dict schemas. Fields only found in
+        other are appended in the order they were seen.
+
+        :param schema: dict of field SchemaNodes, updated in place
+        :param other: dict of field SchemaNodes to merge in
+        :return: merged dict of field SchemaNodes
+        """
+        for k, v in other.items():
+            schema[k] = self.merge_item(schema[k], v) if k in schema else v
+        return schema
+
+    def merge_item(self, item, other):
+        """
+        Unify two schemas inferred for the same field. Integers are widened
+        to floats, a null example marks the field nullable and conflicting
+        types are kept as a list of allowed types. Nested schemas are merged
+        with an explicit stack, so depth isn't limited by recursion.
+
+        :param item: SchemaNode for field, updated in place, or None
+        :param other: SchemaNode for field to merge in
+        :return: merged SchemaNode for field
+        """
+        # merging is idempotent, and equal leaf schemas are the common case
+        if item is None:
+            return other
+        if item.schema is None and other.schema is None and item == other:
+            return item
+
+        root = [item]
+        # (container, key, node to merge into container[key]), where
+        # container is a dict of fields, or a SchemaNode to merge the schema of
+        stack = [(root, 0, other)]
+        while stack:
+            container, key, other = stack.pop()
+            item = container.schema if key is None else container[key]
+            nullable = item.nullable or other.nullable
+
+            if item.allow_unknown is not None or other.allow_unknown is not None:
+                # allow_unknown is already the most permissive schema
+                item = item if item.allow_unknown is not None else other
+            elif other.type is None:
+                pass
+            elif item.type is None:
+                item = other
+            elif item.type == other.type:
+                if item.type == 'dict':
+                    schema = item.schema
+                    for k, v in other.schema.items():
+                        if k in schema:
+                            stack.append((schema, k, v))
+                        else:
+                            schema[k] = v
+                elif item.type == 'list':
+                    if item.schema is None:
+                        item.schema = other.schema
+                    elif other.schema is not None:
+                        stack.append((item, None, other.schema))
+                elif item.type == 'objectid':
+                    if other.resource is not None:
+                        item.resource = other.resource
+                elif item.type in ('integer', 'float'):
+                    self.merge_range(item, other)
+            else:
+                types = []
+                for t in (item.type, other.type):
+                    for name in (t if isinstance(t, list) else [t]):
+                        if name not in types:
+                            types.append(name)
+                if 'integer' in types and 'float' in types:
+                    types.remove('float')
+                    types[types.index('integer')] = 'float'
+
+                if types == ['float']:
+                    item.type = 'float'
+                    self.merge_range(item, other)
+                else:
+                    # sub-schemas of different types can't be unified
+                    item.schema = item.resource = item.min = item.max = None
+                    item.type = types
+
+            if nullable:
+                item.nullable = True
+            if key is None:
+                container.schema = item
+            else:
+                container[key] = item
+        return root[0]
+
+    def merge_range(self, item, other):
+        """
+        Widen the min/max of a numeric field to cover another example.
+
+        :param item: SchemaNode for field, updated in place
+        :param other: SchemaNode for field to merge in
+        :return:
+        """
+        if other.min is not None:
+            item.min = other.min if item.min is None else min(item.min, other.min)
+        if other.max is not None:
+            item.max = other.max if item.max is None else max(item.max, other.max)
 
     def parse_item(self, endpoint_item):
         """
-        Recursivily takes the values of an endpoint's field from its raw
-        json and convets it to the eve schema equivalent of that field.
+        Takes the values of an endpoint's field from its raw json and
+        converts it to the eve schema equivalent of that field. Nested
+        values are handled with an explicit stack rather than recursion, so
+        any depth of nesting can be parsed.
 
         :param endpoint_item: dict of field within an endpoint
-        :return: dict representing eve schema for field
-        """
-        item = OrderedDict([('type', self.get_type(endpoint_item))])
-        if item['type'] == 'dict':
-            # recursively parse each item in a dict and add to item schema
-            item['schema'] = OrderedDict()
-            for k, i in endpoint_item.items():
-                item['schema'][k] = self.parse_item(i)
-
-                # if allow_unknown, remove the type and set allow_unknown.
-                if k == 'allow_unknown' and isinstance(i, bool):
-                    del item['schema']
-                    del item['type']
-                    item[k] = i
-        elif item['type'] == 'list':
-            # recursively parse each item in a list and add to item schema
-            item['schema'] = OrderedDict()
-            for i in endpoint_item:
-                item['schema'] = self.parse_item(i)
-        elif item['type'] == 'objectid':
-            # add extra data_relation for objectid types
-            match = self.objectidregex.match(endpoint_item).group(1)
-            if match:
-                item['data_relation'] = OrderedDict([
-                    ('resource', match),
-                    ('field', '_id'),
-                    ('embeddable', True),
-                ])
-        elif item['type'] == 'integer':
-            # if string, it's really an integer range
-            if isinstance(endpoint_item, str):
-                match = self.intrangeregex.match(endpoint_item).group(1, 2)
-                if match:
-                    item['min'] = int(match[0])
-                    item['max'] = int(match[1])
-        elif item['type'] == 'float':
-            # if string, it's really a float range
-            if isinstance(endpoint_item, str):
-                match = self.floatrangeregex.match(endpoint_item).group(1, 2)
-                if match:
-                    item['min'] = float(match[0])
-                    item['max'] = float(match[1])
-        elif item['type'] == 'null':
-            # if null, don't assume any type, just set nullable to true.
-            item['nullable'] = True
-            del item['type']
-
-        return item
+        :return: SchemaNode for field
+        """
+        classify = self.classify
+        eve_type, payload = classify(endpoint_item)
+        if eve_type != 'dict' and eve_type != 'list':
+            return _scalar_item(eve_type, payload)
+
+        root = [None]
+        # (_DICT or _LIST, value, container, key): parse value into container[key]
+        # (_NEXT, node, items iterator, None): parse the rest of a list's items
+        # (_MERGE, node, [parsed list item], None): merge a parsed list item
+        stack = [(_DICT if eve_type == 'dict' else _LIST, endpoint_item, root, 0)]
+        while stack:
+            op, value, container, key = stack.pop()
+
+            if op == _DICT:
+                if isinstance(value.get('allow_unknown'), bool):
+                    # if allow_unknown, drop the type and set allow_unknown.
+                    container[key] = SchemaNode(allow_unknown=value['allow_unknown'])
+                    continue
+                schema = {}
+                container[key] = SchemaNode('dict', schema)
+                for k, i in value.items():
+                    eve_type, payload = classify(i)
+                    if eve_type == 'dict':
+                        # placeholder keeps the key's position until parsed
+                        schema[k] = None
+                        stack.append((_DICT, i, schema, k))
+                    elif eve_type == 'list':
+                        schema[k] = None
+                        stack.append((_LIST, i, schema, k))
+                    else:
+                        schema[k] = _scalar_item(eve_type, payload)
+                continue
+
+            if op == _LIST:
+                # parse a sample of the list and merge the item schemas in order
+                node = container[key] = SchemaNode('list')
+                container = iter(self.sample_list(value))
+            elif op == _MERGE:
+                value.schema = self.merge_item(value.schema, container[0])
+                continue
+            else:
+                node = value
+
+            merged = node.schema
+            for i in container:
+                eve_type, payload = classify(i)
+                if eve_type == 'dict' or eve_type == 'list':
+                    # parse the nested item before merging it and moving on
+                    parsed = [None]
+                    stack.append((_NEXT, node, container, None))
+                    stack.append((_MERGE, node, parsed, None))
+                    stack.append((_DICT if eve_type == 'dict' else _LIST, i, parsed, 0))
+                    break
+                merged = self.merge_item(merged, _scalar_item(eve_type, payload))
+            node.schema = merged
+
+        return root[0]
+
+    def sample_list(self, values):
+        """
+        Pick the items of a list used to infer its schema, bounded by
+        list_sample.
+
+        :param values: list from source json
+        :return: list of sampled items
+        """
+        k = self.list_sample
+        if k is None or len(values) <= k:
+            return values
+        if k < 1:
+            return []
+        if self.list_strategy == 'first':
+            return values[:k]
+        if self.list_strategy == 'stride':
+            return values[::int(math.ceil(len(values) / float(k)))]
+
+        # reservoir sampling (algorithm L), jumping over skipped items. Seeded
+        # by length so output doesn't depend on which process parses it.
+        rng = random.Random(len(values))
+        sample = values[:k]
+        # the weight is kept as its log, so it can't round up to 1
+        log_w = _log_random(rng) / k
+        i = k - 1
+        while True:
+            i += int(_log_random(rng) / math.log(-math.expm1(log_w))) + 1
+            if i >= len(values):
+                return sample
+            sample[rng.randrange(k)] = values[i]
+            log_w += _log_random(rng) / k
 
     def get_type(self, source):
         """
@@ -117,78 +681,246 @@ class EveGenie(object):
         :param source: value from source json field
         :return: eve schema type representing source type
         """
-        type_mapper = {
-            #unicode: 'string',
-            str: 'string',
-            bool: 'boolean',
-            int: 'integer',
-            float: 'float',
-            dict: 'dict',
-            list: 'list',
-            OrderedDict: 'dict',
-            type(None): 'null',
-        }
-        source_type = type(source)
-
-
-        if source_type in type_mapper:
-            eve_type = type_mapper[source_type]
-        else:
-            print(source_type)
-            raise TypeError('Value types must be in [{0}]'.format(', '.join(type_mapper.values())))
+        return self.classify(source)[0]
+
+    def classify(self, source):
+        """
+        Map a python value to its Eve schema value type along with the data
+        parsed from evegenie special strings.
+
+        :param source: value from source json field
+        :return: tuple of eve schema type and the relation target or
+            (min, max) of special strings, otherwise None
+        """
+        try:
+            eve_type = self.type_mapper[type(source)]
+        except KeyError:
+            raise TypeError('Value types must be in [{0}]'.format(', '.join(self.type_mapper.values())))
 
         # Evegenie special strings
         if eve_type == 'string':
-            if self.objectidregex.match(source):
-                eve_type = 'objectid'
-            elif self.intrangeregex.match(source):
-                eve_type = 'integer'
-            elif self.floatrangeregex.match(source):
-                eve_type = 'float'
+            return classify_string(source)
 
-        return eve_type
+        return eve_type, None
 
-    def format_endpoint(self, endpoint_schema):
+    def format_endpoint(self, endpoint_schema, refs=None):
         """
         Render endpoint schema for readability.  This adds indentation and line breaks.
 
-        :param endpoint_schema: dict of eve schema
+        :param endpoint_schema: dict of eve schema or SchemaNode
+        :param refs: dict mapping id() of shared SchemaNodes to their
+            variable names, see shape_names
         :return string of eve schema ready for output
         """
+        with self.phase('format'):
+            endpoint = io.StringIO()
+            write_literal(endpoint_schema, endpoint, refs=refs)
+            return endpoint.getvalue()
 
-        # separators prevents trailing whitespace, sort_keys false keeps order of ordereddict
-        endpoint = json.dumps(endpoint_schema, indent=4, separators=(',', ': '), sort_keys=False)
-        updates = [
-            ('"', '\''), # replace doubles with singles
-            ('true', 'True'), # convert json booleans to python ones
-            ('false', 'False')
-        ]
-        for needle, sub in updates:
-            endpoint = endpoint.replace(needle, sub)
+    def validator(self, endpoint, allow_unknown=False):
+        """
+        Compile a function validating documents of an endpoint.
+
+        :param endpoint: endpoint name
+        :param allow_unknown: whether fields missing from the schema are allowed
+        :return: function returning the dict of errors of a document
+        """
+        from .validate import compile_validator
+        return compile_validator(self[endpoint]['schema'], allow_unknown=allow_unknown)
 
-        return endpoint
+    def shape_names(self):
+        """
+        Name a settings file variable for each nested schema repeated
+        across endpoints, after the field it was first found in.
+
+        :return: OrderedDict of variable name to SchemaNode, where each
+            shape comes after the shapes it refers to
+        """
+        taken = set(_TEMPLATE_NAMES)
+        taken.update(endpoint.replace('-', '_') for endpoint in self.endpoints)
+        names = OrderedDict()
+        for hint, node in shared_shapes(self.endpoints.values()):
+            base = re.sub(r'\W', '_', str(hint)) + '_schema'
+            if not base.isidentifier() or keyword.iskeyword(base):
+                base = '_' + base
+            name, n = base, 1
+            while name in taken:
+                n += 1
+                name = '{}_{}'.format(base, n)
+            taken.add(name)
+            names[name] = node
+        return names
 
     def write_file(self, filename):
         """
-        Pass schema object to template engine to be rendered for use.
+        Pass schema object to template engine to be rendered for use. The
+        output is streamed to the file and each endpoint is only formatted
+        when the template reaches it. With a sidecar format DOMAIN is
+        written to its own file instead, see write_sidecar.
 
         :param filename: output filename
         :return:
         """
-        template = self.template_env.get_template('settings.py.j2')
+        sidecar = None
+        if self.sidecar is not None:
+            sidecar_filename = self.sidecar_filename(filename)
+            self.write_sidecar(sidecar_filename)
+            sidecar = {'literal': ascii(os.path.basename(sidecar_filename)), 'module': self.sidecar}
 
-        settings = template.render(
-            endpoints=OrderedDict([(endpoint, self.format_endpoint(schema)) for endpoint, schema in self.endpoints.items()])
-        )
         with open(filename, 'w') as ofile:
-            ofile.write(settings + "\n")
+            self.render(ofile, sidecar)
+
+    def render(self, ofile, sidecar=None):
+        """
+        Render the settings file to a text stream.
+
+        :param ofile: text stream to write to
+        :param sidecar: dict of the sidecar's filename literal and module
+            when DOMAIN is loaded from a sidecar, see write_file
+        :return:
+        """
+        template = settings_template()
+
+        shapes = OrderedDict()
+        refs = None
+        if self.share_shapes:
+            shapes = self.shape_names()
+            refs = {id(node): name for name, node in shapes.items()}
+            shapes = OrderedDict([(name, _FormattedEndpoint(self, None, node, refs)) for name, node in shapes.items()])
+        endpoints = OrderedDict([(endpoint, _FormattedEndpoint(self, endpoint, schema, refs)) for endpoint, schema in self.endpoints.items()])
+        with self.phase('render'):
+            template.stream(shapes=shapes, endpoints=endpoints, sidecar=sidecar).dump(ofile)
+            ofile.write("\n")
+
+    def sidecar_filename(self, filename):
+        """
+        :param filename: settings filename
+        :return: filename of the DOMAIN sidecar next to the settings file,
+            such as settings.domain-json, which no input extension matches
+        """
+        return '{}.domain-{}'.format(os.path.splitext(filename)[0], self.sidecar)
+
+    def write_sidecar(self, filename):
+        """
+        Write DOMAIN as plain dicts in the sidecar format, so loading it at
+        startup doesn't need to compile and evaluate the nested literals.
+
+        :param filename: sidecar filename
+        :return:
+        """
+        domain = {name: to_dict(schema, factory=dict) for name, schema in self.endpoints.items()}
+        with self.phase('render'):
+            if self.sidecar == 'json':
+                with open(filename, 'w') as ofile:
+                    json.dump(domain, ofile, separators=(',', ':'))
+            else:
+                with open(filename, 'wb') as ofile:
+                    if self.sidecar == 'marshal':
+                        marshal.dump(domain, ofile)
+                    else:
+                        pickle.dump(domain, ofile, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def __getstate__(self):
+        # worker processes only need the parse options, not parsed results
+        state = self.__dict__.copy()
+        state['endpoints'] = OrderedDict()
+        state['formatted'] = {}
+        state['digests'] = {}
+        state['converted'] = {}
+        state['shapes'] = ShapeTable()
+        state['hashes'] = SchemaHashes()
+        state['stats'] = None
+        state.pop('classify', None)
+        return state
 
     def __iter__(self):
-       for k, v in self.endpoints.items():
-          yield k, v
+        for k in self.endpoints:
+            yield k, self[k]
 
     def __len__(self):
         return len(self.endpoints)
 
     def __getitem__(self, k):
-        return self.endpoints[k]
+        """
+        :param k: endpoint name
+        :return: eve settings of the endpoint as plain dicts, converted from
+            its SchemaNode once and shared by later lookups, so they should
+            be treated as read-only
+        """
+        node = self.endpoints[k]
+        converted = self.converted.get(k)
+        if converted is None or converted[0] is not node:
+            converted = self.converted[k] = (node, to_dict(node))
+        return converted[1]
+
+    def __setitem__(self, k, v):
+        """
+        Replace the settings of an endpoint, such as ones changed from a
+        lookup.
+
+        :param k: endpoint name
+        :param v: eve settings dict of the endpoint
+        """
+        self.endpoints[k] = from_dict(v)
+        self.formatted.pop(k, None)
+        self.digests.pop(k, None)
+        self.converted.pop(k, None)
+
+
+class _FormattedEndpoint(object):
+    """
+    Endpoint schema that is formatted when the template renders it.
+    """
+
+    def __init__(self, genie, name, schema, refs=None):
+        self.genie = genie
+        self.name = name
+        self.schema = schema
+        self.refs = refs
+
+    def __str__(self):
+        # cached text has every shape written out
+        if not self.refs and self.name in self.genie.formatted:
+            return self.genie.formatted[self.name]
+        return self.genie.format_endpoint(self.schema, self.refs)
+
+
+class LazyEndpoints(MutableMapping):
+    """
+    Endpoints whose settings are parsed from their source the first time
+    they are accessed and then kept. Length and order are known up front.
+    """
+
+    def __init__(self, parse, sources):
+        """
+        :param parse: function parsing (endpoint name, endpoint source) tuples
+        :param sources: iterable of (endpoint name, endpoint source) tuples
+        """
+        self.parse = parse
+        self.sources = OrderedDict(sources)
+        self.parsed = {}
+
+    def __getitem__(self, k):
+        if k not in self.parsed:
+            self.parsed[k] = self.parse([(k, self.sources[k])])[k]
+            # the source isn't needed once parsed, only its position
+            self.sources[k] = None
+        return self.parsed[k]
+
+    def __contains__(self, k):
+        # the Mapping default looks the endpoint up, which would parse it
+        return k in self.sources
+
+    def __setitem__(self, k, v):
+        self.sources.setdefault(k, None)
+        self.parsed[k] = v
+
+    def __delitem__(self, k):
+        del self.sources[k]
+        self.parsed.pop(k, None)
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def __len__(self):
+        return len(self.sources)
@@ -0,0 +1,91 @@
+"""
+Walks over the fields of records and of folded schemas, shared by the
+analyzers of records so every record and schema is walked once however
+many of them are enabled.
+
+Fields are named by their path, a tuple of the keys leading to them, where
+ITEMS stands for the items of a list.
+"""
+
+
+# path component standing for the items of a list
+ITEMS = '[]'
+
+
+class RecordWalker(object):
+    """
+    Hands every value of records to the collectors taking values of its
+    type, with the path of its field. Each collector has an add(path,
+    value) method and a value_types tuple of the types it takes.
+    """
+
+    def __init__(self, collectors):
+        """
+        :param collectors: collectors of the values of records, such as
+            EndpointPresence or EndpointRanges
+        """
+        self.collectors = collectors
+        # class of a value -> add methods of the collectors taking it
+        self.targets = {}
+
+    def targets_of(self, kind):
+        """
+        :param kind: class of a value
+        :return: add methods of the collectors taking values of the class
+        """
+        targets = self.targets[kind] = [collector.add for collector in self.collectors
+                                        if issubclass(kind, collector.value_types)]
+        return targets
+
+    def walk(self, record):
+        """
+        Hand the values of one record to the collectors, walking nested
+        values with an explicit stack. The record itself is handed over
+        first, with the empty path.
+
+        :param record: dict record of an endpoint
+        :return:
+        """
+        targets = self.targets
+        adds = targets.get(record.__class__)
+        if adds is None:
+            adds = self.targets_of(record.__class__)
+        for add in adds:
+            add((), record)
+        stack = [((), record)]
+        while stack:
+            path, value = stack.pop()
+            if isinstance(value, dict):
+                children = ((path + (k,), v) for k, v in value.items())
+            else:
+                children = ((path + (ITEMS,), v) for v in value)
+            for child_path, child in children:
+                kind = child.__class__
+                adds = targets.get(kind)
+                if adds is None:
+                    adds = self.targets_of(kind)
+                for add in adds:
+                    add(child_path, child)
+                if isinstance(child, (dict, list)):
+                    stack.append((child_path, child))
+
+
+def walk_schema(schema):
+    """
+    Walk the fields of a folded schema with an explicit stack, nested
+    fields and list items included. A node may be changed before the walk
+    moves on, such as a string field retyped.
+
+    :param schema: dict of field SchemaNodes
+    :return: generator of (path, SchemaNode) tuples
+    """
+    stack = [((k,), v) for k, v in schema.items()]
+    while stack:
+        path, node = stack.pop()
+        if node is None:
+            continue
+        yield path, node
+        if node.type == 'dict' and node.schema:
+            stack.extend((path + (k,), v) for k, v in node.schema.items())
+        elif node.type == 'list' and node.schema is not None:
+            stack.append((path + (ITEMS,), node.schema))
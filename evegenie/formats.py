@@ -0,0 +1,240 @@
+"""
+Detection of the formats of the string fields of records.
+
+Every string is first screened on its length and a few characters at fixed
+positions, which rejects almost all strings of other formats and plain
+text, and only the strings passing that are matched with a regex or parsed.
+"""
+import re
+from collections import Counter, OrderedDict
+from datetime import datetime
+from string import hexdigits
+
+
+# format -> eve type replacing string. Eve only parses strings in its
+# DATE_FORMAT, RFC 1123, into datetimes, so other datetimes stay strings.
+FORMAT_TYPES = OrderedDict([
+    ('datetime', 'datetime'),
+    ('objectid', 'objectid'),
+])
+# format -> regex rule of the strings, in the anchored-at-the-end form
+# Cerberus matches regex rules with
+FORMAT_REGEXES = OrderedDict([
+    ('uuid', r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'),
+    ('email', r'[^@\s]+@[^@\s]+\.[^@\s]+'),
+    ('url', r'https?://[^\s/?#]+[^\s]*'),
+    # ISO 8601 dates, with an optional time and UTC offset. Parts are
+    # checked in range, except for days past the end of shorter months.
+    ('iso8601', r'\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12]\d|3[01])'
+                r'(?:[T ](?:[01]\d|2[0-3]):[0-5]\d(?::[0-5]\d(?:\.\d{1,9})?)?(?:Z|[+-]\d{2}:?\d{2})?)?'),
+])
+FORMATS = tuple(FORMAT_TYPES) + tuple(FORMAT_REGEXES)
+
+_UUID = re.compile(FORMAT_REGEXES['uuid'] + '$')
+_EMAIL = re.compile(FORMAT_REGEXES['email'] + '$')
+_URL = re.compile(FORMAT_REGEXES['url'] + '$')
+_ISO_DATETIME = re.compile(FORMAT_REGEXES['iso8601'] + '$')
+# RFC 1123 dates, Eve's DATE_FORMAT
+_RFC1123_DATETIME = re.compile(
+    r'(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun), (?:0[1-9]|[12]\d|3[01]) '
+    r'(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) \d{4} (?:[01]\d|2[0-3]):[0-5]\d:[0-5]\d GMT$')
+_MONTHS = {name: i + 1 for i, name in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'))}
+
+
+def _valid_date(year, month, day):
+    """
+    Check a day past the 28th is in its month.
+    """
+    try:
+        datetime(year, month, day)
+    except ValueError:
+        return False
+    return True
+
+
+def detect_format(value):
+    """
+    Find the format of a string, if any.
+
+    :param value: string value from a record
+    :return: one of FORMATS, or None for strings of no format
+    """
+    n = len(value)
+    if n == 24 and not value.strip(hexdigits):
+        return 'objectid'
+    if n == 36 and value[8] == '-' and value[23] == '-' and _UUID.match(value):
+        return 'uuid'
+    first = value[:1]
+    if '0' <= first <= '9':
+        if 10 <= n <= 35 and value[4] == '-' and _ISO_DATETIME.match(value):
+            day = value[8:10]
+            if day <= '28' or _valid_date(int(value[:4]), int(value[5:7]), int(day)):
+                return 'iso8601'
+            return None
+    elif n == 29 and value[3] == ',':
+        if _RFC1123_DATETIME.match(value):
+            day = value[5:7]
+            if day <= '28' or _valid_date(int(value[12:16]), _MONTHS[value[8:11]], int(day)):
+                return 'datetime'
+            return None
+    elif first == 'h' and value[4:7] in ('://', 's:/') and _URL.match(value):
+        return 'url'
+    if 5 <= n <= 254 and '@' in value and _EMAIL.match(value):
+        return 'email'
+    return None
+
+
+class FieldFormats(object):
+    """
+    Formats of a sample of the strings of a field. Every string is taken
+    until `sample_size` of them were, then every second one for the next
+    `sample_size`, every fourth one after that, and so on, so the sample
+    spans all records while its size only grows with their logarithm.
+    """
+
+    __slots__ = ('count', 'sampled', 'stride', 'next_stride', 'batch', 'formats')
+
+    def __init__(self, sample_size):
+        self.count = 0
+        self.sampled = 0
+        self.stride = 1
+        # sampled strings at which the stride doubles
+        self.next_stride = sample_size
+        # sampled strings not detected yet
+        self.batch = []
+        # format or None -> number of sampled strings
+        self.formats = Counter()
+
+
+class EndpointFormats(object):
+    """
+    Formats of the string fields of the records of one endpoint, keyed by
+    the path of each field.
+    """
+
+    # types of the values sampled, see RecordWalker
+    value_types = (str,)
+
+    def __init__(self, sample_size, batch_size):
+        """
+        :param sample_size: strings sampled per field before the sample
+            thins out, see FieldFormats
+        :param batch_size: sampled strings buffered per field before
+            detecting their formats
+        """
+        self.sample_size = sample_size
+        self.batch_size = batch_size
+        # path of a field -> FieldFormats
+        self.fields = {}
+
+    def add(self, path, value):
+        """
+        Sample one value of a field when it is a string, see RecordWalker.
+
+        :param path: path of the field, empty for the record itself
+        :param value: value of the field
+        :return:
+        """
+        if not isinstance(value, str):
+            return
+        column = self.fields.get(path)
+        if column is None:
+            column = self.fields[path] = FieldFormats(self.sample_size)
+        column.count += 1
+        if column.count % column.stride:
+            return
+        column.batch.append(value)
+        if len(column.batch) >= self.batch_size:
+            self.detect(column)
+
+    def detect(self, column):
+        """
+        Count the formats of the buffered strings of a field and empty the
+        buffer.
+
+        :param column: FieldFormats of the field
+        :return:
+        """
+        column.formats.update(map(detect_format, column.batch))
+        column.sampled += len(column.batch)
+        del column.batch[:]
+        while column.sampled >= column.next_stride:
+            column.stride *= 2
+            column.next_stride += self.sample_size
+
+    def flush(self):
+        """
+        Detect the formats of the strings still buffered for every field.
+        """
+        for column in self.fields.values():
+            if column.batch:
+                self.detect(column)
+
+
+class StringFormats(object):
+    """
+    Finds string fields of records holding datetimes, objectids, uuids,
+    emails, urls or ISO 8601 dates. A field takes a format when at least
+    `threshold` of its sampled strings are in it: datetime and objectid
+    fields become of that type, and the other fields get a regex rule.
+    """
+
+    def __init__(self, threshold=0.95, sample_size=1000, batch_size=256, formats=FORMATS):
+        """
+        :param threshold: share of the sampled strings of a field that must
+            be in a format for the field to take it
+        :param sample_size: strings sampled per field before the sample
+            thins out
+        :param batch_size: sampled strings buffered per field before
+            detecting their formats
+        :param formats: formats fields may take, of FORMATS
+        """
+        for name in formats:
+            if name not in FORMATS:
+                raise ValueError('Format must be in [{0}]'.format(', '.join(FORMATS)))
+        self.threshold = threshold
+        self.sample_size = sample_size
+        self.batch_size = batch_size
+        self.formats = formats
+        # endpoint name -> EndpointFormats
+        self.endpoints = OrderedDict()
+
+    def endpoint(self, name):
+        """
+        :param name: endpoint name
+        :return: new EndpointFormats sampling the strings of the endpoint
+        """
+        strings = self.endpoints[name] = EndpointFormats(self.sample_size, self.batch_size)
+        return strings
+
+    def format(self, column):
+        """
+        :param column: FieldFormats of a field, with nothing left buffered
+        :return: format the field takes, or None
+        """
+        if not column.sampled:
+            return None
+        for name in self.formats:
+            if column.formats[name] >= self.threshold * column.sampled:
+                return name
+        return None
+
+    def apply(self, strings, path, node):
+        """
+        Set the type or regex of a field of a folded schema when it is a
+        string field whose strings are in a format, see walk_schema.
+
+        :param strings: EndpointFormats of the endpoint's records, flushed
+        :param path: path of the field
+        :param node: SchemaNode of the field, updated in place
+        :return:
+        """
+        if node.type != 'string':
+            return
+        column = strings.fields.get(path)
+        name = self.format(column) if column is not None else None
+        if name in FORMAT_TYPES:
+            node.type = FORMAT_TYPES[name]
+        elif name is not None:
+            node.regex = FORMAT_REGEXES[name]
@@ -0,0 +1,207 @@
+"""
+Reader for the .bson collection files written by mongodump.
+
+Files are memory-mapped and documents are decoded one at a time straight
+from the mapping, so a collection of any size is read with memory bounded
+by its largest document. Values are decoded only as far as inferring a
+schema needs: BSON types without a json equivalent become the small types
+below, which EveGenie maps to their eve types.
+"""
+import mmap
+import os
+import struct
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+_INT32 = struct.Struct('<i')
+_UINT64 = struct.Struct('<Q')
+_INT64 = struct.Struct('<q')
+_DOUBLE = struct.Struct('<d')
+_EPOCH = datetime(1970, 1, 1)
+
+
+class ObjectId(bytes):
+    """
+    The 12 bytes of a BSON ObjectId, eve type objectid.
+    """
+
+    def __repr__(self):
+        return 'ObjectId({!r})'.format(self.hex())
+
+
+class Decimal128(bytes):
+    """
+    The 16 undecoded bytes of a BSON decimal128, eve type decimal.
+    """
+
+    def __repr__(self):
+        return 'Decimal128({!r})'.format(self.hex())
+
+
+def iter_documents(filename):
+    """
+    Read the documents of a mongodump .bson file one at a time.
+
+    :param filename: .bson file of one collection
+    :return: generator of OrderedDict documents
+    """
+    with open(filename, 'rb') as ifile:
+        if os.fstat(ifile.fileno()).st_size == 0:
+            return
+        with mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            with memoryview(buf) as view:
+                offset = 0
+                while offset < len(buf):
+                    document, offset = decode_document(buf, view, offset)
+                    yield document
+
+
+def iter_collections(path):
+    """
+    Find the collections of a mongodump database directory.
+
+    :param path: .bson file, or directory of .bson files
+    :return: generator of (collection name, generator of documents) tuples
+    """
+    if os.path.isdir(path):
+        filenames = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.bson'))
+    else:
+        filenames = [path]
+    for filename in filenames:
+        yield collection_name(filename), iter_documents(filename)
+
+
+def collection_name(filename):
+    """
+    :param filename: .bson file
+    :return: name of the collection dumped to it
+    """
+    return os.path.basename(filename)[:-len('.bson')] if filename.endswith('.bson') else os.path.basename(filename)
+
+
+def decode_document(buf, view, offset):
+    """
+    Decode one BSON document. Nested documents and arrays are decoded with
+    an explicit stack, so any depth of nesting can be read.
+
+    :param buf: mmap or bytes holding the document
+    :param view: memoryview of buf, strings are decoded from it without
+        copying
+    :param offset: position of the document in buf
+    :return: tuple of the OrderedDict document and the offset after it
+    """
+    int32 = _INT32.unpack_from
+    find = buf.find
+    size = len(buf)
+    if offset + 5 > size:
+        raise ValueError('Truncated BSON document at offset {}'.format(offset))
+    end = offset + int32(buf, offset)[0]
+    if end > size or end < offset + 5 or buf[end - 1] != 0:
+        raise ValueError('Invalid BSON document at offset {}'.format(offset))
+
+    document = OrderedDict()
+    # (dict or list being filled, it is a list, offset of its terminating NUL)
+    stack = [(document, False, end - 1)]
+    container, is_list, container_end = stack[-1]
+    pos = offset + 4
+    while True:
+        if pos >= container_end:
+            stack.pop()
+            pos = container_end + 1
+            if not stack:
+                break
+            container, is_list, container_end = stack[-1]
+            continue
+
+        kind = buf[pos]
+        key_end = find(b'\x00', pos + 1, container_end)
+        if key_end < 0:
+            raise ValueError('Invalid BSON element at offset {}'.format(pos))
+        # array keys are just the index
+        key = None if is_list else str(view[pos + 1:key_end], 'utf-8')
+        pos = key_end + 1
+
+        if kind == 0x03 or kind == 0x04:
+            child_end = pos + int32(buf, pos)[0] - 1
+            if child_end > container_end or buf[child_end] != 0:
+                raise ValueError('Invalid BSON document at offset {}'.format(pos))
+            value = OrderedDict() if kind == 0x03 else []
+            if is_list:
+                container.append(value)
+            else:
+                container[key] = value
+            container, is_list, container_end = value, kind == 0x04, child_end
+            stack.append((container, is_list, container_end))
+            pos += 4
+            continue
+
+        if kind == 0x02 or kind == 0x0D or kind == 0x0E:
+            # string, javascript code, symbol
+            length = int32(buf, pos)[0]
+            value = str(view[pos + 4:pos + 3 + length], 'utf-8')
+            pos += 4 + length
+        elif kind == 0x01:
+            value = _DOUBLE.unpack_from(buf, pos)[0]
+            pos += 8
+        elif kind == 0x10:
+            value = int32(buf, pos)[0]
+            pos += 4
+        elif kind == 0x12:
+            value = _INT64.unpack_from(buf, pos)[0]
+            pos += 8
+        elif kind == 0x07:
+            value = ObjectId(view[pos:pos + 12])
+            pos += 12
+        elif kind == 0x08:
+            value = buf[pos] != 0
+            pos += 1
+        elif kind == 0x09:
+            milliseconds = _INT64.unpack_from(buf, pos)[0]
+            try:
+                value = _EPOCH + timedelta(milliseconds=milliseconds)
+            except OverflowError:
+                value = datetime.max if milliseconds > 0 else datetime.min
+            pos += 8
+        elif kind == 0x0A or kind == 0x06 or kind == 0x7F or kind == 0xFF:
+            # null, undefined, max key, min key
+            value = None
+        elif kind == 0x13:
+            value = Decimal128(view[pos:pos + 16])
+            pos += 16
+        elif kind == 0x05:
+            length = int32(buf, pos)[0]
+            value = bytes(view[pos + 5:pos + 5 + length])
+            pos += 5 + length
+        elif kind == 0x11:
+            # internal timestamp
+            value = _UINT64.unpack_from(buf, pos)[0]
+            pos += 8
+        elif kind == 0x0B:
+            # regular expression, pattern and options
+            pattern_end = find(b'\x00', pos, container_end)
+            options_end = find(b'\x00', pattern_end + 1, container_end)
+            if pattern_end < 0 or options_end < 0:
+                raise ValueError('Invalid BSON regex at offset {}'.format(pos))
+            value = str(view[pos:pattern_end], 'utf-8')
+            pos = options_end + 1
+        elif kind == 0x0C:
+            # DBPointer, a namespace and an ObjectId
+            length = int32(buf, pos)[0]
+            value = ObjectId(view[pos + 4 + length:pos + 16 + length])
+            pos += 16 + length
+        elif kind == 0x0F:
+            # javascript code with scope, the scope is skipped
+            length = int32(buf, pos + 4)[0]
+            value = str(view[pos + 8:pos + 7 + length], 'utf-8')
+            pos += int32(buf, pos)[0]
+        else:
+            raise ValueError('Unknown BSON type 0x{:02x} at offset {}'.format(kind, pos))
+
+        if pos > container_end:
+            raise ValueError('Truncated BSON element at offset {}'.format(pos))
+        if is_list:
+            container.append(value)
+        else:
+            container[key] = value
+    return document, end
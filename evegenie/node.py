@@ -0,0 +1,330 @@
+"""
+Compact in-memory representation of inferred eve schemas.
+"""
+from collections import OrderedDict
+
+
+class SchemaNode(object):
+    """
+    Eve schema of a single field, using slots instead of a dict per field.
+    The schema of a dict field is a dict of field names to SchemaNodes and
+    the schema of a list field is the SchemaNode of its items. An endpoint
+    is a SchemaNode with only a schema.
+
+    Attributes that are None are left out of the eve schema, and the rules
+    are always laid out in the same order.
+    """
+
+    __slots__ = ('type', 'schema', 'resource', 'allowed', 'regex', 'min', 'max', 'allow_unknown', 'required',
+                 'nullable', 'empty')
+
+    def __init__(self, type=None, schema=None, resource=None, allowed=None, regex=None, min=None, max=None,
+                 allow_unknown=None, required=None, nullable=None, empty=None):
+        self.type = type
+        self.schema = schema
+        # related resource of an objectid, see data_relation
+        self.resource = resource
+        # sorted list of the values of a categorical field
+        self.allowed = allowed
+        # pattern of the strings of a field, see StringFormats
+        self.regex = regex
+        self.min = min
+        self.max = max
+        self.allow_unknown = allow_unknown
+        self.required = required
+        self.nullable = nullable
+        self.empty = empty
+
+    def items(self):
+        """
+        :return: list of (rule, value) tuples of the eve schema, where
+            nested schemas are still SchemaNodes
+        """
+        items = []
+        if self.type is not None:
+            items.append(('type', self.type))
+        if self.schema is not None:
+            items.append(('schema', self.schema))
+        elif self.type == 'list':
+            # a list without any items
+            items.append(('schema', {}))
+        if self.resource is not None:
+            items.append(('data_relation', self.data_relation()))
+        if self.allowed is not None:
+            items.append(('allowed', self.allowed))
+        if self.regex is not None:
+            items.append(('regex', self.regex))
+        if self.min is not None:
+            items.append(('min', self.min))
+        if self.max is not None:
+            items.append(('max', self.max))
+        if self.allow_unknown is not None:
+            items.append(('allow_unknown', self.allow_unknown))
+        if self.required is not None:
+            items.append(('required', self.required))
+        if self.nullable:
+            items.append(('nullable', True))
+        if self.empty is not None:
+            items.append(('empty', self.empty))
+        return items
+
+    def data_relation(self):
+        return OrderedDict([
+            ('resource', self.resource),
+            ('field', '_id'),
+            ('embeddable', True),
+        ])
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, SchemaNode):
+            return NotImplemented
+        return all(getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'SchemaNode({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in self.items()))
+
+
+def to_dict(value, factory=OrderedDict):
+    """
+    Convert a SchemaNode, or a dict of field names to SchemaNodes, into the
+    plain eve schema dicts. Nested nodes are converted with an explicit
+    stack, so any depth of nesting can be converted.
+
+    :param value: SchemaNode or dict of SchemaNodes
+    :param factory: mapping type of the converted dicts, such as dict for
+        serializers that only take exact dicts
+    :return: OrderedDict eve schema
+    """
+    root = [None]
+    # (SchemaNode or dict of fields, container, key): convert into container[key]
+    stack = [(value, root, 0)]
+    while stack:
+        source, container, key = stack.pop()
+        result = container[key] = factory()
+        if isinstance(source, SchemaNode):
+            for k, v in source.items():
+                if k == 'schema':
+                    # placeholder keeps the key's position until converted
+                    result[k] = None
+                    stack.append((v, result, k))
+                elif isinstance(v, list):
+                    result[k] = list(v)
+                elif isinstance(v, dict):
+                    result[k] = factory(v)
+                else:
+                    result[k] = v
+        else:
+            for k, v in source.items():
+                result[k] = None
+                stack.append((v, result, k))
+    return root[0]
+
+
+def from_dict(value, fields=False):
+    """
+    Convert a plain eve schema dict into a SchemaNode. This reverses
+    to_dict, with an explicit stack so any depth of nesting can be converted.
+
+    :param value: eve schema dict of a field or an endpoint
+    :param fields: value is a dict of field names to eve schemas instead
+    :return: SchemaNode, or dict of field names to SchemaNodes with fields
+    """
+    root = [None]
+    # (source, container, key, source is a dict of fields), where container
+    # is a dict to set key in, or a SchemaNode to set the schema of
+    stack = [(value, root, 0, fields)]
+    while stack:
+        source, container, key, is_fields = stack.pop()
+        if is_fields:
+            result = dict.fromkeys(source)
+            for k, v in source.items():
+                stack.append((v, result, k, False))
+        else:
+            result = SchemaNode(
+                type=source.get('type'),
+                allowed=list(source['allowed']) if 'allowed' in source else None,
+                regex=source.get('regex'),
+                min=source.get('min'),
+                max=source.get('max'),
+                allow_unknown=source.get('allow_unknown'),
+                required=source.get('required'),
+                nullable=source.get('nullable'),
+                empty=source.get('empty'),
+            )
+            if isinstance(result.type, list):
+                result.type = list(result.type)
+            if 'data_relation' in source:
+                result.resource = source['data_relation']['resource']
+            schema = source.get('schema')
+            if result.type == 'list':
+                if schema:
+                    stack.append((schema, result, None, False))
+            elif schema is not None:
+                stack.append((schema, result, None, True))
+
+        if isinstance(container, SchemaNode):
+            container.schema = result
+        else:
+            container[key] = result
+    return root[0]
+
+
+class ShapeTable(object):
+    """
+    Hash-consing table of SchemaNodes, so equal sub-schemas of finished
+    endpoints share one node in memory. Nodes are only interned once their
+    endpoint is complete, since merging updates nodes in place, and must be
+    treated as read-only after that.
+    """
+
+    def __init__(self):
+        # structural key -> canonical SchemaNode
+        self.nodes = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def intern_fields(self, fields):
+        """
+        Replace each field schema of an endpoint with its canonical node.
+
+        :param fields: dict of field SchemaNodes, updated in place
+        :return: fields
+        """
+        nodes = self.nodes
+        for k, v in fields.items():
+            fields[k] = _intern_leaf(nodes, v) if v.schema is None else self.intern(v)
+        return fields
+
+    def intern(self, node):
+        """
+        Find the canonical node equal to a schema, interning its nested
+        schemas first. Nodes are walked with an explicit stack, so any depth
+        of nesting can be interned.
+
+        :param node: SchemaNode, whose nested schemas are updated in place
+        :return: canonical SchemaNode equal to node
+        """
+        nodes = self.nodes
+        if node.schema is None:
+            return _intern_leaf(nodes, node)
+
+        root = [node]
+        # (node, container, key, nested schemas are interned): intern the
+        # node into container[key], or the schema of container if key is None.
+        # Leaves are interned right away, only nested schemas are stacked.
+        stack = [(node, root, 0, False)]
+        while stack:
+            current, container, key, ready = stack.pop()
+            schema = current.schema
+            if isinstance(schema, SchemaNode):
+                if not ready:
+                    if schema.schema is not None:
+                        stack.append((current, container, key, True))
+                        stack.append((schema, current, None, False))
+                        continue
+                    current.schema = schema = _intern_leaf(nodes, schema)
+                nested = id(schema)
+            else:
+                if not ready:
+                    for k, v in schema.items():
+                        if v.schema is None:
+                            schema[k] = _intern_leaf(nodes, v)
+                        else:
+                            if not ready:
+                                ready = True
+                                stack.append((current, container, key, True))
+                            stack.append((v, schema, k, False))
+                    if ready:
+                        continue
+                nested = tuple([(k, id(v)) for k, v in schema.items()])
+
+            canonical = nodes.setdefault(_key(current, nested), current)
+            if key is None:
+                container.schema = canonical
+            else:
+                container[key] = canonical
+        return root[0]
+
+
+def _intern_leaf(nodes, node):
+    """
+    :param nodes: dict of key to canonical SchemaNode
+    :param node: SchemaNode without a nested schema
+    :return: canonical SchemaNode equal to node
+    """
+    if (node.resource is None and node.allowed is None and node.regex is None and node.min is None
+            and node.max is None and node.allow_unknown is None and node.required is None and node.nullable is None
+            and node.empty is None and node.type.__class__ is str):
+        # the most common leaves, a bare type, are keyed by the type
+        return nodes.setdefault(node.type, node)
+    return nodes.setdefault(_key(node, None), node)
+
+
+def _key(node, nested):
+    """
+    :param node: SchemaNode whose nested schemas are interned
+    :param nested: id of the interned list item schema, or tuple of field
+        names and ids of the interned field schemas, or None
+    :return: hashable key equal for equal nodes
+    """
+    return (
+        tuple(node.type) if isinstance(node.type, list) else node.type,
+        nested,
+        node.resource,
+        None if node.allowed is None else tuple(node.allowed),
+        node.regex,
+        # 1 and 1.0 are equal but written differently
+        type(node.min), node.min,
+        type(node.max), node.max,
+        node.allow_unknown,
+        node.required,
+        node.nullable,
+        node.empty,
+    )
+
+
+def shared_shapes(endpoints):
+    """
+    Find the nested dict and list schemas referenced from more than one
+    place across endpoints, which after interning are the repeated shapes.
+
+    :param endpoints: iterable of endpoint SchemaNodes
+    :return: list of (name hint, SchemaNode) tuples, where each node comes
+        after the shared nodes it contains. The hint is the field name of
+        the first reference.
+    """
+    references = {}
+    hints = {}
+    order = []
+    # (node, name hint, nested schemas are visited)
+    stack = []
+    for endpoint in reversed(list(endpoints)):
+        stack.extend((v, k, False) for k, v in reversed(list(endpoint.schema.items())))
+    while stack:
+        node, hint, ready = stack.pop()
+        if ready:
+            order.append(node)
+            continue
+        if id(node) in references:
+            references[id(node)] += 1
+            continue
+        references[id(node)] = 1
+        hints[id(node)] = hint
+        schema = node.schema
+        if not schema:
+            continue
+        stack.append((node, hint, True))
+        if isinstance(schema, SchemaNode):
+            stack.append((schema, '{}_item'.format(hint), False))
+        else:
+            stack.extend((v, k, False) for k, v in reversed(list(schema.items())))
+    return [(hints[id(node)], node) for node in order if references[id(node)] > 1]
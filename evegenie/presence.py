@@ -0,0 +1,129 @@
+"""
+Field presence statistics of the records of an endpoint.
+"""
+from collections import Counter, OrderedDict
+
+from .fields import ITEMS
+
+
+class FieldCounters(object):
+    """
+    How often a field was present, null or empty, and the eve types of its
+    values.
+    """
+
+    __slots__ = ('present', 'null', 'empty', 'types')
+
+    def __init__(self):
+        self.present = 0
+        self.null = 0
+        self.empty = 0
+        self.types = Counter()
+
+
+class EndpointPresence(object):
+    """
+    Field counters of the records of one endpoint, keyed by the path of
+    each field. Memory grows with the number of distinct fields, not with
+    the number of records.
+    """
+
+    # types of the values counted, see RecordWalker
+    value_types = (object,)
+
+    def __init__(self, type_mapper):
+        """
+        :param type_mapper: dict mapping python types to eve types
+        """
+        self.type_mapper = type_mapper
+        # path of a dict -> number of times a dict was seen there
+        self.instances = Counter()
+        # path of a field -> FieldCounters
+        self.fields = {}
+
+    def add(self, path, value):
+        """
+        Count one value of a field, see RecordWalker.
+
+        :param path: path of the field, empty for the record itself
+        :param value: value of the field
+        :return:
+        """
+        if isinstance(value, dict):
+            self.instances[path] += 1
+        if not path:
+            return
+        counters = self.fields.get(path)
+        if counters is None:
+            counters = self.fields[path] = FieldCounters()
+        counters.present += 1
+        eve_type = self.type_mapper.get(type(value), 'unknown')
+        counters.types[eve_type] += 1
+        if value is None:
+            counters.null += 1
+        elif eve_type in ('string', 'list', 'dict') and not value:
+            counters.empty += 1
+
+    def flush(self):
+        """
+        Nothing is buffered, values are counted as they are added.
+        """
+
+
+class FieldPresence(object):
+    """
+    Turns field presence statistics of records into required, nullable and
+    empty rules, using thresholds on the share of records:
+
+    - required when a field is in at least `required` of the records
+      holding its parent
+    - nullable when more than `nullable` of its values are null, or all are
+    - empty: False when at most `empty` of its strings, lists or dicts are
+      empty
+    """
+
+    def __init__(self, required=1.0, nullable=0.0, empty=0.0):
+        """
+        :param required: share of records a field must be in to be required
+        :param nullable: share of null values above which a field is nullable
+        :param empty: share of empty values up to which a field is non-empty
+        """
+        self.required = required
+        self.nullable = nullable
+        self.empty = empty
+        # endpoint name -> EndpointPresence
+        self.endpoints = OrderedDict()
+
+    def endpoint(self, name, type_mapper):
+        """
+        :param name: endpoint name
+        :param type_mapper: dict mapping python types to eve types
+        :return: new EndpointPresence counting the records of the endpoint
+        """
+        presence = self.endpoints[name] = EndpointPresence(type_mapper)
+        return presence
+
+    def apply(self, presence, path, node):
+        """
+        Set the required, nullable and empty rules of a field of a folded
+        schema, see walk_schema.
+
+        :param presence: EndpointPresence of the endpoint's records
+        :param path: path of the field
+        :param node: SchemaNode of the field, updated in place
+        :return:
+        """
+        counters = presence.fields.get(path)
+        if counters is None:
+            return
+
+        if path[-1] != ITEMS:
+            parents = presence.instances[path[:-1]]
+            node.required = True if parents and counters.present >= self.required * parents else None
+        values = counters.present - counters.null
+        if counters.null and (not values or counters.null > self.nullable * counters.present):
+            node.nullable = True
+        else:
+            node.nullable = None
+        if values and node.type in ('string', 'list', 'dict'):
+            node.empty = False if counters.empty <= self.empty * values else None
@@ -0,0 +1,271 @@
+"""
+Inference of the numeric ranges of the fields of records.
+
+Numbers are appended to typed arrays per field and reduced a batch at a
+time, with NumPy when it is installed and with the builtin min and max over
+the arrays otherwise, so the reductions run in C rather than per value.
+
+Whether a float field only holds whole numbers isn't checked: the field
+couldn't become an integer field, since Eve's integer type rejects floats
+such as 3.0 in the very records the schema is inferred from.
+"""
+import math
+import random
+from array import array
+from collections import OrderedDict
+
+
+# smallest number random() returns other than 0.0
+RANDOM_EPSILON = 2.0 ** -53
+
+# numpy module, imported on first use since importing it is slow, and
+# False when it isn't installed
+_numpy = None
+
+
+def _get_numpy():
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy
+
+
+def _percentile(ordered, q):
+    """
+    Percentile of sorted values, interpolated linearly like numpy.percentile.
+
+    :param ordered: sorted list of numbers
+    :param q: percentile, 0 to 100
+    :return: number
+    """
+    position = (len(ordered) - 1) * q / 100.0
+    lower = int(math.floor(position))
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class ColumnRange(object):
+    """
+    Range of the numbers of a field, with the numbers not reduced yet
+    buffered in typed arrays.
+    """
+
+    __slots__ = ('count', 'low', 'high', 'ints', 'floats', 'sample', 'seen', 'log_weight', 'skip_to')
+
+    def __init__(self):
+        self.count = 0
+        self.low = None
+        self.high = None
+        self.ints = array('q')
+        self.floats = array('d')
+        # uniform sample of the numbers, kept for percentiles
+        self.sample = []
+        # numbers offered to the sample, and the state of its reservoir
+        self.seen = 0
+        # log of the reservoir's weight, which can't round up to 1 as a log
+        self.log_weight = 0.0
+        self.skip_to = 0
+
+    def bound(self, low, high):
+        if self.low is None or low < self.low:
+            self.low = low
+        if self.high is None or high > self.high:
+            self.high = high
+
+
+class EndpointRanges(object):
+    """
+    Numeric ranges of the records of one endpoint, keyed by the path of each
+    field.
+    """
+
+    # types of the values buffered, see RecordWalker
+    value_types = (int, float)
+
+    def __init__(self, ranges):
+        """
+        :param ranges: NumericRanges holding the batch and sample settings
+        """
+        self.batch_size = ranges.batch_size
+        self.sample_size = ranges.sample_size if ranges.percentiles else 0
+        self.numpy = _get_numpy() if ranges.use_numpy is not False else False
+        if ranges.use_numpy and not self.numpy:
+            raise ImportError('numpy is needed with use_numpy=True')
+        self.random = random.Random(0)
+        # path of a field -> ColumnRange
+        self.fields = {}
+
+    def add(self, path, value):
+        """
+        Buffer one value of a field when it is a number, see RecordWalker.
+
+        :param path: path of the field, empty for the record itself
+        :param value: value of the field
+        :return:
+        """
+        kind = value.__class__
+        if kind is not int and kind is not float:
+            return
+        column = self.fields.get(path)
+        if column is None:
+            column = self.fields[path] = ColumnRange()
+        if kind is int:
+            try:
+                column.ints.append(value)
+            except OverflowError:
+                # beyond 64 bits, bound it right away
+                column.count += 1
+                column.bound(value, value)
+                if self.sample_size:
+                    self.keep(column, [value])
+        else:
+            column.floats.append(value)
+        if len(column.ints) + len(column.floats) >= self.batch_size:
+            self.reduce(column)
+
+    def reduce(self, column):
+        """
+        Fold the buffered numbers of a field into its range and empty the
+        buffers. NaN and infinities have no place in a range and are left
+        out.
+
+        :param column: ColumnRange of the field
+        :return:
+        """
+        np = self.numpy
+        for values, dtype in ((column.ints, 'int64'), (column.floats, 'float64')):
+            if not values:
+                continue
+            if np:
+                batch = np.frombuffer(values, dtype=dtype)
+                if dtype == 'float64':
+                    batch = batch[np.isfinite(batch)]
+                if len(batch):
+                    column.count += len(batch)
+                    column.bound(batch.min().item(), batch.max().item())
+                    if self.sample_size:
+                        self.keep(column, batch)
+                # release the view before the array is resized
+                batch = None
+            else:
+                batch = values
+                if dtype == 'float64':
+                    if not all(map(math.isfinite, batch)):
+                        batch = [v for v in batch if math.isfinite(v)]
+                if len(batch):
+                    column.count += len(batch)
+                    column.bound(min(batch), max(batch))
+                    if self.sample_size:
+                        self.keep(column, batch)
+            del values[:]
+
+    def keep(self, column, values):
+        """
+        Reservoir sample the numbers of a field for its percentiles. Once
+        the sample is full, the numbers replacing one of it are found by
+        skipping ahead (Li's algorithm L), so the cost grows with the number
+        of replacements rather than the number of values.
+
+        :param column: ColumnRange of the field
+        :param values: list, array or numpy array of numbers
+        :return:
+        """
+        size = self.sample_size
+        sample = column.sample
+        start = column.seen
+        column.seen += len(values)
+        rnd = self.random.random
+
+        def log_random():
+            # random() may return 0.0
+            return math.log(rnd() or RANDOM_EPSILON)
+
+        if len(sample) < size:
+            room = size - len(sample)
+            head = values[:room]
+            sample.extend(head.tolist() if hasattr(head, 'tolist') else head)
+            if len(sample) < size:
+                return
+            column.log_weight = log_random() / size
+            column.skip_to = start + room + int(log_random() / math.log(-math.expm1(column.log_weight)))
+        while column.skip_to < column.seen:
+            value = values[column.skip_to - start]
+            sample[self.random.randrange(size)] = value.item() if hasattr(value, 'item') else value
+            column.log_weight += log_random() / size
+            column.skip_to += int(log_random() / math.log(-math.expm1(column.log_weight))) + 1
+
+    def flush(self):
+        """
+        Reduce the numbers still buffered for every field.
+        """
+        for column in self.fields.values():
+            if column.ints or column.floats:
+                self.reduce(column)
+
+
+class NumericRanges(object):
+    """
+    Sets min and max on the integer and float fields of records from the
+    numbers they hold. With percentiles, the bounds are the given
+    percentiles of a uniform sample of the numbers instead of the extremes,
+    so outliers don't widen the range.
+    """
+
+    def __init__(self, batch_size=4096, percentiles=None, sample_size=10000, use_numpy=None):
+        """
+        :param batch_size: numbers buffered per field before reducing them
+        :param percentiles: (low, high) percentiles clipping the range, such
+            as (1, 99), or None for the smallest and largest numbers
+        :param sample_size: numbers sampled per field for percentiles
+        :param use_numpy: reduce with numpy, by default when it is installed
+        """
+        self.batch_size = batch_size
+        self.percentiles = percentiles
+        self.sample_size = sample_size
+        self.use_numpy = use_numpy
+        # endpoint name -> EndpointRanges
+        self.endpoints = OrderedDict()
+
+    def endpoint(self, name):
+        """
+        :param name: endpoint name
+        :return: new EndpointRanges collecting the numbers of the endpoint
+        """
+        ranges = self.endpoints[name] = EndpointRanges(self)
+        return ranges
+
+    def bounds(self, column):
+        """
+        :param column: ColumnRange of a field, with nothing left buffered
+        :return: tuple of the low and high bound of the field
+        """
+        if not self.percentiles or not column.sample:
+            return column.low, column.high
+        ordered = sorted(column.sample)
+        return _percentile(ordered, self.percentiles[0]), _percentile(ordered, self.percentiles[1])
+
+    def apply(self, ranges, path, node):
+        """
+        Set min and max of a field of a folded schema when it is an integer
+        or float field, leaving ranges already set from special strings,
+        see walk_schema.
+
+        :param ranges: EndpointRanges of the endpoint's records, flushed
+        :param path: path of the field
+        :param node: SchemaNode of the field, updated in place
+        :return:
+        """
+        if node.type not in ('integer', 'float'):
+            return
+        column = ranges.fields.get(path)
+        if column is None or not column.count or node.min is not None or node.max is not None:
+            return
+        low, high = self.bounds(column)
+        if node.type == 'integer':
+            node.min, node.max = int(math.floor(low)), int(math.ceil(high))
+        else:
+            node.min, node.max = float(low), float(high)
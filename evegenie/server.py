@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+"""
+Local HTTP service generating eve settings, for tools that would otherwise
+start geneve.py once per input.
+
+POST json to /settings for the rendered settings file or to /schema for
+DOMAIN as json. Parse options are taken from the query string, for example
+/settings?list_sample=100&list_strategy=stride&share_shapes=1. Workers keep
+the template compiled, and results are cached by a hash of the request.
+
+    python -m evegenie.server --port 8765
+    curl --data-binary @sample.json http://127.0.0.1:8765/settings
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+from .evegenie import EveGenie, LIST_STRATEGIES, settings_template
+
+
+KINDS = ('settings', 'schema')
+CONTENT_TYPES = {
+    'settings': 'text/x-python; charset=utf-8',
+    'schema': 'application/json',
+}
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+
+class RequestError(Exception):
+    """
+    Request the service can't answer, sent back with its HTTP status.
+    """
+
+    def __init__(self, status, message):
+        super(RequestError, self).__init__(message)
+        self.status = status
+
+    def __reduce__(self):
+        # raised in worker processes, so it must survive pickling
+        return RequestError, (self.status, str(self))
+
+
+def warm_template():
+    """
+    Compile the settings template once per process.
+    """
+    settings_template()
+
+
+def generate(kind, options, body):
+    """
+    Generate settings or schema json from an input document. Runs in the
+    worker processes.
+
+    :param kind: 'settings' or 'schema'
+    :param options: keyword arguments passed on to EveGenie
+    :param body: json input as bytes
+    :return: generated output as bytes
+    """
+    try:
+        eg = EveGenie(data=body.decode('utf-8'), **options)
+    except (ValueError, TypeError) as e:
+        raise RequestError(400, '{}: {}'.format(type(e).__name__, e))
+    if kind == 'schema':
+        return json.dumps(OrderedDict(eg), indent=4).encode('utf-8')
+    output = io.StringIO()
+    eg.render(output)
+    return output.getvalue().encode('utf-8')
+
+
+def parse_options(query):
+    """
+    :param query: query string of the request
+    :return: dict of EveGenie keyword arguments
+    """
+    options = {}
+    for k, v in parse_qsl(query):
+        if k == 'list_sample':
+            try:
+                options[k] = int(v)
+            except ValueError:
+                raise RequestError(400, 'list_sample must be an integer')
+        elif k == 'list_strategy':
+            if v not in LIST_STRATEGIES:
+                raise RequestError(400, 'list_strategy must be in [{}]'.format(', '.join(LIST_STRATEGIES)))
+            options[k] = v
+        elif k == 'share_shapes':
+            options[k] = v.lower() in ('1', 'true', 'yes')
+        else:
+            raise RequestError(400, 'Unknown option {}'.format(k))
+    return options
+
+
+class SchemaServer(object):
+    """
+    Serves generated settings over HTTP, handling requests concurrently and
+    parsing inputs in a process pool. Results are kept in an LRU cache keyed
+    by a hash of the request, and concurrent identical requests share one
+    generation.
+    """
+
+    def __init__(self, workers=None, cache_size=256, max_body=64 * 1024 * 1024):
+        """
+        :param workers: number of worker processes, inputs are parsed in the
+            serving process when 0
+        :param cache_size: number of results kept in the LRU cache
+        :param max_body: largest accepted request body in bytes
+        """
+        self.workers = workers
+        self.cache_size = cache_size
+        self.max_body = max_body
+        self.cache = OrderedDict()
+        # cache key -> future of a generation in progress
+        self.running = {}
+        self.hits = 0
+        self.misses = 0
+        self.pool = None
+        if workers != 0:
+            self.pool = ProcessPoolExecutor(max_workers=workers, initializer=warm_template)
+        else:
+            warm_template()
+
+    async def start(self, host='127.0.0.1', port=8765, path=None):
+        """
+        :param host: address to listen on
+        :param port: TCP port to listen on, any free port when 0
+        :param path: unix socket to listen on instead of host and port
+        :return: asyncio server
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path=path)
+        return await asyncio.start_server(self.handle, host=host, port=port)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def key(self, kind, options, body):
+        digest = hashlib.sha256()
+        digest.update(json.dumps([kind, options], sort_keys=True).encode('utf-8'))
+        digest.update(body)
+        return digest.hexdigest()
+
+    async def generate(self, kind, options, body):
+        """
+        Generate output for a request, from the cache when possible.
+
+        :param kind: 'settings' or 'schema'
+        :param options: keyword arguments passed on to EveGenie
+        :param body: json input as bytes
+        :return: generated output as bytes
+        """
+        key = self.key(kind, options, body)
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        if key in self.running:
+            self.hits += 1
+            return await asyncio.shield(self.running[key])
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        if self.pool is not None:
+            future = loop.run_in_executor(self.pool, generate, kind, options, body)
+        else:
+            future = loop.create_future()
+            try:
+                future.set_result(generate(kind, options, body))
+            except Exception as e:
+                future.set_exception(e)
+        self.running[key] = future
+        try:
+            output = await asyncio.shield(future)
+        finally:
+            del self.running[key]
+
+        self.cache[key] = output
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return output
+
+    async def respond(self, method, target, body):
+        """
+        :param method: HTTP method
+        :param target: request target, path and query string
+        :param body: request body
+        :return: tuple of status, content type and body of the response
+        """
+        url = urlsplit(target)
+        kind = url.path.strip('/')
+        if kind == 'stats' and method == 'GET':
+            stats = OrderedDict([('hits', self.hits), ('misses', self.misses), ('cached', len(self.cache))])
+            return 200, 'application/json', json.dumps(stats).encode('utf-8')
+        if kind not in KINDS:
+            raise RequestError(404, 'Unknown path {}, use /{}'.format(url.path, ' or /'.join(KINDS)))
+        if method != 'POST':
+            raise RequestError(405, 'POST a json document')
+        output = await self.generate(kind, parse_options(url.query), body)
+        return 200, CONTENT_TYPES[kind], output
+
+    async def handle(self, reader, writer):
+        """
+        Serve the HTTP/1.1 requests of one connection, keeping it open
+        between requests unless asked to close it.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                    length = int(headers.get('content-length', 0))
+                    if length > self.max_body:
+                        keep_alive = False
+                        raise RequestError(413, 'Request body is larger than {} bytes'.format(self.max_body))
+                    body = await reader.readexactly(length)
+                    status, content_type, output = await self.respond(method, target, body)
+                except RequestError as e:
+                    status, content_type, output = e.status, 'text/plain; charset=utf-8', (str(e) + '\n').encode('utf-8')
+                except ValueError:
+                    keep_alive = False
+                    status, content_type, output = 400, 'text/plain; charset=utf-8', b'Malformed request\n'
+                except asyncio.IncompleteReadError:
+                    break
+                except Exception as e:
+                    status, content_type, output = 500, 'text/plain; charset=utf-8', '{}: {}\n'.format(type(e).__name__, e).encode('utf-8')
+
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+                    status, REASONS[status], content_type, len(output), 'keep-alive' if keep_alive else 'close').encode('latin-1'))
+                writer.write(output)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(server, host='127.0.0.1', port=8765, path=None):
+    """
+    Run a SchemaServer until cancelled.
+    """
+    listener = await server.start(host=host, port=port, path=path)
+    print('serving on {}'.format(path or ', '.join('{}:{}'.format(*s.getsockname()[:2]) for s in listener.sockets)))
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve generated eve settings over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port to listen on')
+    parser.add_argument('--unix', metavar='PATH', default=None, help='listen on a unix socket instead')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                        help='worker processes parsing inputs, 0 parses in the server process')
+    parser.add_argument('--cache-size', type=int, default=256, help='number of results kept in memory')
+    args = parser.parse_args()
+
+    server = SchemaServer(workers=args.workers, cache_size=args.cache_size)
+    try:
+        asyncio.run(serve(server, host=args.host, port=args.port, path=args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
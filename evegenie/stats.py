@@ -0,0 +1,210 @@
+"""
+Instrumentation of EveGenie conversions.
+"""
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+
+# time spent in a phase excludes the phases nested inside it
+PHASES = ('load', 'parse', 'classify', 'format', 'render')
+
+
+class EndpointStats(object):
+    """
+    Measurements of parsing a single endpoint.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.nodes = Counter()
+        self.max_depth = 0
+        self.peak_bytes = None
+
+    def as_dict(self):
+        return OrderedDict([
+            ('seconds', self.seconds),
+            ('nodes', OrderedDict(sorted(self.nodes.items()))),
+            ('max_depth', self.max_depth),
+            ('peak_bytes', self.peak_bytes),
+        ])
+
+
+class GenieStats(object):
+    """
+    Wall time per phase, plus node counts per eve type, schema depth and
+    peak memory for each endpoint parsed in this process.
+    """
+
+    def __init__(self, memory=False, profiler=None):
+        """
+        :param memory: trace allocations to measure each endpoint's peak
+            memory, which slows parsing down noticeably
+        :param profiler: callable taking a phase name and returning a
+            context manager wrapped around each run of that phase, such as
+            ProfilerHook. Classification runs per value and isn't wrapped.
+        """
+        self.memory = memory
+        self.profiler = profiler
+        self.phases = OrderedDict((phase, 0.0) for phase in PHASES)
+        self.nodes = Counter()
+        self.endpoints = OrderedDict()
+        self._current = None
+        # [phase, seconds spent in nested phases] of the running phases
+        self._stack = []
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a phase, excluding nested phases, wrapped in the profiler hook.
+
+        :param name: one of PHASES
+        """
+        hook = self.profiler(name) if self.profiler is not None else nullcontext()
+        frame = [name, 0.0]
+        self._stack.append(frame)
+        start = perf_counter()
+        try:
+            with hook:
+                yield
+        finally:
+            elapsed = perf_counter() - start
+            self._stack.pop()
+            self.phases[name] += elapsed - frame[1]
+            if self._stack:
+                self._stack[-1][1] += elapsed
+
+    @contextmanager
+    def endpoint(self, name):
+        """
+        Measure parsing of one endpoint.
+
+        :param name: endpoint name
+        :return: EndpointStats of the endpoint
+        """
+        endpoint = self.endpoints[name] = EndpointStats()
+        self._current = endpoint
+        started = False
+        if self.memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started = True
+            elif hasattr(tracemalloc, 'reset_peak'):
+                # Python 3.9+, before that an earlier peak can't be cleared
+                tracemalloc.reset_peak()  # novermin
+            base, base_peak = tracemalloc.get_traced_memory()
+        start = perf_counter()
+        try:
+            with self.phase('parse'):
+                yield endpoint
+        finally:
+            endpoint.seconds = perf_counter() - start
+            if self.memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                # unknown when it stayed under a peak from before the endpoint
+                endpoint.peak_bytes = peak - base if peak > base_peak or base_peak == base else None
+                if started:
+                    tracemalloc.stop()
+            self._current = None
+
+    def classifier(self, classify):
+        """
+        Wrap EveGenie.classify to time classification and count nodes.
+
+        :param classify: function returning (eve type, payload) of a value
+        :return: instrumented function
+        """
+        def timed_classify(source):
+            start = perf_counter()
+            result = classify(source)
+            elapsed = perf_counter() - start
+            self.phases['classify'] += elapsed
+            if self._stack:
+                self._stack[-1][1] += elapsed
+            self.nodes[result[0]] += 1
+            if self._current is not None:
+                self._current.nodes[result[0]] += 1
+            return result
+        return timed_classify
+
+    def as_dict(self):
+        """
+        :return: stats as plain dicts, ready for json
+        """
+        return OrderedDict([
+            ('phases', OrderedDict(self.phases)),
+            ('nodes', OrderedDict(sorted(self.nodes.items()))),
+            ('endpoints', OrderedDict((k, v.as_dict()) for k, v in self.endpoints.items())),
+        ])
+
+    def report(self):
+        """
+        :return: human readable summary of the stats
+        """
+        lines = ['phase        seconds']
+        for phase, seconds in self.phases.items():
+            lines.append('{:<10} {:9.4f}'.format(phase, seconds))
+        lines.append('total      {:9.4f}'.format(sum(self.phases.values())))
+        lines.append('nodes: ' + ', '.join('{} {}'.format(k, v) for k, v in sorted(self.nodes.items())))
+        if self.endpoints:
+            lines.append('')
+            lines.append('endpoint                    seconds  nodes  depth   peak KiB')
+            for name, endpoint in self.endpoints.items():
+                peak = '{:10.1f}'.format(endpoint.peak_bytes / 1024.0) if endpoint.peak_bytes is not None else '         -'
+                lines.append('{:<24} {:10.4f} {:6d} {:6d} {}'.format(
+                    name, endpoint.seconds, sum(endpoint.nodes.values()), endpoint.max_depth, peak))
+        return '\n'.join(lines)
+
+
+class ProfilerHook(object):
+    """
+    Profiler hook running cProfile around the chosen phases, accumulating
+    one profile per phase.
+    """
+
+    def __init__(self, phases=PHASES):
+        self.phases = phases
+        self.profiles = OrderedDict()
+
+    @contextmanager
+    def __call__(self, phase):
+        if phase not in self.phases:
+            yield
+            return
+        if phase not in self.profiles:
+            import cProfile
+            self.profiles[phase] = cProfile.Profile()
+        profile = self.profiles[phase]
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def print_stats(self, limit=15, sort='cumulative'):
+        import pstats
+        for phase, profile in self.profiles.items():
+            print('profile of {}'.format(phase))
+            pstats.Stats(profile).sort_stats(sort).print_stats(limit)
+
+
+def schema_depth(schema):
+    """
+    Nesting depth of an endpoint schema, where top level fields are depth 1.
+
+    :param schema: dict of field SchemaNodes of an endpoint
+    :return: deepest level of nested dict and list schemas
+    """
+    depth = 0
+    stack = [(node, 1) for node in schema.values()]
+    while stack:
+        node, level = stack.pop()
+        depth = max(depth, level)
+        if node.schema is None:
+            continue
+        if node.type == 'dict':
+            stack.extend((child, level + 1) for child in node.schema.values())
+        elif node.type == 'list':
+            stack.append((node.schema, level + 1))
+    return depth
@@ -0,0 +1,131 @@
+"""
+Incremental readers for large EveGenie inputs.
+"""
+import json
+from collections import OrderedDict
+
+
+WHITESPACE = ' \t\n\r'
+
+
+class _Reader(object):
+    """
+    Buffered character reader over a text file object. Only the unconsumed
+    tail of the input is kept in memory.
+    """
+
+    def __init__(self, ifile, chunk_size):
+        self.ifile = ifile
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=None):
+        """
+        Read another chunk from the file, dropping consumed text first.
+
+        :param size: number of characters to read, defaults to chunk_size
+        :return: False if the file is exhausted
+        """
+        if self.eof:
+            return False
+        chunk = self.ifile.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Skip whitespace and return the next significant character.
+
+        :return: next character, or '' at end of input
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError('Expected {!r} in JSON input, found {!r}'.format(char, found))
+        self.pos += 1
+
+    def decode(self, decoder):
+        """
+        Decode the next complete JSON value, reading more input until the
+        value is complete. Reads grow geometrically so a large value is
+        decoded a logarithmic number of times.
+
+        :param decoder: json.JSONDecoder used for the value
+        :return: decoded value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill(max(self.chunk_size, len(self.buf) - self.pos)):
+                    raise
+                continue
+            # a number at the end of the buffer may still be truncated
+            if end == len(self.buf) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_endpoints(ifile, chunk_size=1 << 16):
+    """
+    Incrementally read a top level JSON object from a file and yield each
+    endpoint as soon as it is complete. Peak memory is bounded by the
+    largest single endpoint rather than the whole document.
+
+    :param ifile: text file object containing a JSON object
+    :param chunk_size: number of characters read at a time
+    :return: generator of (endpoint name, endpoint source) tuples
+    """
+    decoder = json.JSONDecoder(object_pairs_hook=OrderedDict)
+    reader = _Reader(ifile, chunk_size)
+
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        if reader.peek() != '"':
+            raise ValueError('Expected endpoint name in JSON input')
+        key = reader.decode(decoder)
+        reader.expect(':')
+        yield key, reader.decode(decoder)
+
+        char = reader.peek()
+        reader.pos += 1
+        if char == '}':
+            break
+        if char != ',':
+            raise ValueError("Expected ',' or '}}' in JSON input, found {!r}".format(char))
+
+    if reader.peek():
+        raise ValueError('Extra data after JSON object')
+
+
+def iter_records(ifile):
+    """
+    Read records from a JSON lines file (as written by mongoexport), one
+    record per line.
+
+    :param ifile: text file object with one JSON object per line
+    :return: generator of records
+    """
+    decoder = json.JSONDecoder(object_pairs_hook=OrderedDict)
+    for line in ifile:
+        line = line.strip()
+        if line:
+            yield decoder.decode(line)
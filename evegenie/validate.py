@@ -0,0 +1,397 @@
+"""
+Validators compiled from inferred schemas.
+
+The rules of a schema are turned into the source of plain Python functions,
+one per nested dict schema and one per list item schema, so a document is
+checked with straight-line isinstance and comparison code instead of
+Cerberus looking up and dispatching every rule of every field. Errors are
+the same dicts Eve's Validator reports:
+
+    validate = compile_validator(OrderedDict(eg)['user']['schema'])
+    errors = validate(document)
+
+data_relation isn't checked, it needs the referenced resources' database.
+"""
+import os
+import re
+from collections import deque
+from collections.abc import Container, Iterable, Mapping, Sequence, Sized
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from itertools import islice
+
+try:
+    from bson import ObjectId as _BsonObjectId
+    from bson.decimal128 import Decimal128 as _Decimal
+except ImportError:
+    _BsonObjectId = None
+    _Decimal = ()
+
+
+# rules a compiled validator checks, in the order Cerberus checks them first
+PRIORITY_RULES = ('nullable', 'type', 'empty')
+# rules without checks of their own, or checked with the parent document
+PASSIVE_RULES = ('allow_unknown', 'required', 'data_relation', 'meta')
+SUPPORTED_RULES = PRIORITY_RULES + PASSIVE_RULES + ('schema', 'allowed', 'regex', 'min', 'max')
+
+# eve type -> python expression testing value
+TYPE_CHECKS = {
+    'binary': 'isinstance(value, (bytes, bytearray))',
+    'boolean': 'isinstance(value, bool)',
+    'container': '(isinstance(value, Container) and not isinstance(value, str))',
+    'date': 'isinstance(value, date)',
+    'datetime': 'isinstance(value, datetime)',
+    'decimal': 'isinstance(value, _Decimal)',
+    'dict': '(type(value) is dict or isinstance(value, Mapping))',
+    'float': 'isinstance(value, (float, int))',
+    'integer': 'isinstance(value, int)',
+    'list': '(type(value) is list or (isinstance(value, Sequence) and not isinstance(value, str)))',
+    'number': '(isinstance(value, (int, float)) and not isinstance(value, bool))',
+    'objectid': '_is_objectid(value)',
+    'set': 'isinstance(value, set)',
+    'string': 'isinstance(value, str)',
+}
+# eve types whose values can always be compared with numbers
+NUMERIC_TYPES = ('float', 'integer', 'number')
+
+_MISSING = object()
+
+
+def _is_objectid(value):
+    """
+    ObjectId.is_valid of bson, which Eve checks objectid fields with.
+    """
+    if _BsonObjectId is not None:
+        return _BsonObjectId.is_valid(value)
+    if not value:
+        return False
+    if isinstance(value, bytes):
+        return len(value) == 12
+    if isinstance(value, str) and len(value) == 24:
+        try:
+            bytes.fromhex(value)
+        except ValueError:
+            return False
+        return True
+    return False
+
+
+def _add(errors, field, message):
+    """
+    Add a message to the errors of a field. Like Cerberus, a field with
+    several errors gets a list, with nested errors last.
+    """
+    entry = errors.get(field)
+    if entry is None:
+        errors[field] = message
+    elif isinstance(entry, list):
+        entry.insert(len(entry) - isinstance(entry[-1], dict), message)
+    elif isinstance(entry, dict):
+        errors[field] = [message, entry]
+    else:
+        errors[field] = [entry, message]
+
+
+def _nest(errors, field, nested):
+    """
+    Add the errors of a nested dict or list to the errors of a field.
+    """
+    entry = errors.get(field)
+    if entry is None:
+        errors[field] = nested
+    elif isinstance(entry, list):
+        entry.append(nested)
+    else:
+        errors[field] = [entry, nested]
+
+
+class _Compiler(object):
+    """
+    Generates the source of the functions validating a schema. Nested
+    schemas are queued and get functions of their own, so any depth of
+    nesting is compiled without recursion.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.constants = {}
+        self.queue = deque()
+        # (id of schema, allow_unknown) -> function name
+        self.names = {}
+        # keeps compiled schemas alive, so their ids stay unique
+        self.schemas = []
+
+    def constant(self, value):
+        name = '_c{}'.format(len(self.constants))
+        self.constants[name] = value
+        return name
+
+    def function(self, kind, schema, allow_unknown):
+        """
+        :param kind: 'm' for a dict of fields, 'i' for the rules of list items
+        :param schema: fields or rules
+        :param allow_unknown: whether unknown fields of nested dicts are allowed
+        :return: name of the function validating schema
+        """
+        key = (kind, id(schema), allow_unknown)
+        if key not in self.names:
+            self.names[key] = '_{}{}'.format(kind, len(self.names))
+            self.schemas.append(schema)
+            self.queue.append((self.names[key], kind, schema, allow_unknown))
+        return self.names[key]
+
+    def compile(self, schema, allow_unknown):
+        """
+        :param schema: dict of field rules
+        :param allow_unknown: whether unknown fields are allowed
+        :return: source of the functions, the top one named after the schema
+        """
+        top = self.function('m', schema, allow_unknown)
+        while self.queue:
+            name, kind, schema, allow_unknown = self.queue.popleft()
+            if kind == 'm':
+                self.mapping(name, schema, allow_unknown)
+            else:
+                self.lines.append('def {}(value, errors, field):'.format(name))
+                self.rules(schema, 'field', allow_unknown, 1)
+                self.lines.append('')
+        self.lines.append('validate = {}'.format(top))
+        return '\n'.join(self.lines) + '\n'
+
+    def mapping(self, name, schema, allow_unknown):
+        lines = self.lines
+        lines.append('def {}(document):'.format(name))
+        lines.append('    errors = {}')
+        if not allow_unknown:
+            lines.append('    known = 0')
+        for k, rules in schema.items():
+            if not isinstance(rules, Mapping):
+                raise ValueError('Rules of field {!r} must be a dict'.format(k))
+            key = repr(k)
+            lines.append('    value = document.get({}, _MISSING)'.format(key))
+            lines.append('    if value is not _MISSING:')
+            if not allow_unknown:
+                lines.append('        known += 1')
+            self.rules(rules, key, allow_unknown, 2)
+            if rules.get('required') is True:
+                lines.append('    else:')
+                lines.append("        _add(errors, {}, 'required field')".format(key))
+        if not allow_unknown:
+            fields = self.constant(frozenset(schema))
+            lines.append('    if known != len(document):')
+            lines.append('        for field in document:')
+            lines.append('            if field not in {}:'.format(fields))
+            lines.append("                _add(errors, field, 'unknown field')")
+        lines.append('    return errors')
+        lines.append('')
+
+    def rules(self, rules, key, allow_unknown, level):
+        """
+        Generate the checks of one value, in the order Cerberus runs them:
+        nullable, type and empty first, and the other rules as written.
+
+        :param rules: rules of the value
+        :param key: expression of the value's key in errors
+        :param allow_unknown: whether unknown fields of the enclosing dict are
+            allowed, inherited by nested dicts
+        :param level: indent level of the generated code
+        """
+        for rule in rules:
+            if rule not in SUPPORTED_RULES:
+                raise ValueError('Rule {!r} can\'t be compiled'.format(rule))
+        if not isinstance(rules.get('allow_unknown', False), bool):
+            raise ValueError('allow_unknown must be a bool to be compiled')
+
+        lines = self.lines
+        indent = '    ' * level
+        lines.append(indent + 'if value is None:')
+        if rules.get('nullable'):
+            lines.append(indent + '    pass')
+        else:
+            lines.append(indent + "    _add(errors, {}, 'null value not allowed')".format(key))
+
+        eve_type = rules.get('type')
+        types = () if not eve_type else (eve_type,) if isinstance(eve_type, str) else tuple(eve_type)
+        if types:
+            for t in types:
+                if t not in TYPE_CHECKS:
+                    raise ValueError('Type {!r} can\'t be compiled'.format(t))
+            lines.append(indent + 'elif not ({}):'.format(' or '.join(TYPE_CHECKS[t] for t in types)))
+            lines.append(indent + '    _add(errors, {}, {!r})'.format(key, 'must be of {} type'.format(eve_type)))
+
+        body = []
+        if 'empty' in rules:
+            body.append('if isinstance(value, Sized) and len(value) == 0:')
+            if rules['empty']:
+                body.append('    pass')
+            else:
+                body.append("    _add(errors, {}, 'empty values not allowed')".format(key))
+        for rule, constraint in rules.items():
+            if rule == 'schema':
+                body.extend(self.schema(rules, types, key, allow_unknown))
+            elif rule == 'allowed':
+                body.extend(self.allowed(rules, types, key))
+            elif rule == 'regex':
+                body.extend(self.regex(rules, key))
+            elif rule in ('min', 'max'):
+                test = 'value {} {}'.format('<' if rule == 'min' else '>', self.constant(constraint))
+                add = '_add(errors, {}, {!r})'.format(key, '{} value is {}'.format(rule, constraint))
+                if types and all(t in NUMERIC_TYPES for t in types) and isinstance(constraint, (int, float)):
+                    body.extend(['if {}:'.format(test), '    ' + add])
+                else:
+                    # Cerberus ignores values that can't be compared
+                    body.extend(['try:', '    if {}:'.format(test), '        ' + add,
+                                 'except TypeError:', '    pass'])
+        if body:
+            lines.append(indent + 'else:')
+            lines.extend(indent + '    ' + line for line in body)
+
+    def allowed(self, rules, types, key):
+        """
+        :return: lines checking a value, or the items of a list, are allowed
+        """
+        if types == ('string',):
+            lines = ['if value not in {}:'.format(self.constant(frozenset(rules['allowed']))),
+                     "    _add(errors, {}, 'unallowed value {{}}'.format(value))".format(key)]
+        else:
+            allowed = self.constant(tuple(rules['allowed']))
+            lines = ['if isinstance(value, Iterable) and not isinstance(value, str):',
+                     '    unallowed = tuple(x for x in value if x not in {})'.format(allowed),
+                     '    if unallowed:',
+                     "        _add(errors, {}, 'unallowed values {{}}'.format(unallowed))".format(key),
+                     'elif value not in {}:'.format(allowed),
+                     "    _add(errors, {}, 'unallowed value {{}}'.format(value))".format(key)]
+        if 'empty' in rules:
+            # Cerberus skips allowed for empty values when empty is set
+            lines = ['if not (isinstance(value, Sized) and len(value) == 0):'] + ['    ' + line for line in lines]
+        return lines
+
+    def regex(self, rules, key):
+        """
+        :return: lines checking a string matches the whole pattern
+        """
+        pattern = rules['regex']
+        # like Cerberus, the pattern is anchored at the end and matched
+        compiled = self.constant(re.compile(pattern if pattern.endswith('$') else pattern + '$'))
+        lines = ['if isinstance(value, str) and not {}.match(value):'.format(compiled),
+                 '    _add(errors, {}, {!r})'.format(key, "value does not match regex '{}'".format(pattern))]
+        if 'empty' in rules:
+            # Cerberus skips regex for empty values when empty is set
+            lines = ['if not (isinstance(value, Sized) and len(value) == 0):'] + ['    ' + line for line in lines]
+        return lines
+
+    def schema(self, rules, types, key, allow_unknown):
+        """
+        :return: lines validating a nested dict or the items of a list
+        """
+        schema = rules['schema']
+        if schema is None:
+            return []
+        if ('dict' in types) == ('list' in types):
+            raise ValueError('A schema rule needs exactly one of the dict and list types to be compiled')
+        if 'dict' in types:
+            name = self.function('m', schema, rules.get('allow_unknown', allow_unknown))
+            lines = ['nested = {}(value)'.format(name)]
+            if types != ('dict',):
+                lines = ['if isinstance(value, Mapping):'] + ['    ' + line for line in lines + ['if nested:', '    _nest(errors, {}, nested)'.format(key)]]
+            else:
+                lines += ['if nested:', '    _nest(errors, {}, nested)'.format(key)]
+            return lines
+
+        name = self.function('i', schema, allow_unknown)
+        lines = ['nested = {}', 'for i, item in enumerate(value):', '    {}(item, nested, i)'.format(name),
+                 'if nested:', '    _nest(errors, {}, nested)'.format(key)]
+        if types != ('list',):
+            lines = ['if isinstance(value, Sequence) and not isinstance(value, str):'] + ['    ' + line for line in lines]
+        return lines
+
+
+def validator_source(schema, allow_unknown=False):
+    """
+    :param schema: dict of field rules, like the schema of an endpoint
+    :param allow_unknown: whether fields missing from schema are allowed
+    :return: tuple of the python source defining validate(document) and
+        the dict of constants it refers to
+    """
+    compiler = _Compiler()
+    return compiler.compile(schema, allow_unknown), compiler.constants
+
+
+def compile_validator(schema, allow_unknown=False):
+    """
+    Compile a schema into a function validating documents against it.
+
+    :param schema: dict of field rules, like the schema of an endpoint
+    :param allow_unknown: whether fields missing from schema are allowed
+    :return: function taking a document and returning a dict of errors in
+        the format of Eve's Validator, empty when the document is valid
+    """
+    source, constants = validator_source(schema, allow_unknown)
+    namespace = dict(constants, _MISSING=_MISSING, _add=_add, _nest=_nest, _is_objectid=_is_objectid,
+                     _Decimal=_Decimal, Container=Container, Iterable=Iterable, Mapping=Mapping,
+                     Sequence=Sequence, Sized=Sized, date=date, datetime=datetime)
+    exec(compile(source, '<evegenie validator>', 'exec'), namespace)
+    check = namespace['validate']
+
+    def validate(document):
+        if not isinstance(document, Mapping):
+            raise TypeError('Documents must be dicts, not {}'.format(type(document).__name__))
+        return check(document)
+
+    validate.source = source
+    return validate
+
+
+# validator of the worker processes of validate_many
+_worker_validate = None
+
+
+def _init_worker(schema, allow_unknown):
+    global _worker_validate
+    _worker_validate = compile_validator(schema, allow_unknown)
+
+
+def _validate_chunk(start, documents):
+    return [(start + i, errors) for i, errors in enumerate(map(_worker_validate, documents)) if errors]
+
+
+def validate_many(schema, documents, workers=None, chunk_size=1000, allow_unknown=False):
+    """
+    Validate many documents, in chunks spread over a process pool. Each
+    worker compiles the schema once, and only a few chunks per worker are
+    in flight, so documents can be streamed from an iterator of any size.
+
+    :param schema: dict of field rules, like the schema of an endpoint
+    :param documents: iterable of documents
+    :param workers: number of worker processes, documents are validated in
+        this process when 0
+    :param chunk_size: number of documents sent to a worker at a time
+    :param allow_unknown: whether fields missing from schema are allowed
+    :return: generator of (index, errors) tuples of the invalid documents,
+        in document order
+    """
+    documents = iter(documents)
+    if workers == 0:
+        validate = compile_validator(schema, allow_unknown)
+        for i, document in enumerate(documents):
+            errors = validate(document)
+            if errors:
+                yield i, errors
+        return
+
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(schema, allow_unknown)) as pool:
+        pending = deque()
+        start = 0
+        while True:
+            while len(pending) < 2 * workers:
+                chunk = list(islice(documents, chunk_size))
+                if not chunk:
+                    break
+                pending.append(pool.submit(_validate_chunk, start, chunk))
+                start += len(chunk)
+            if not pending:
+                break
+            for result in pending.popleft().result():
+                yield result
@@ -0,0 +1,173 @@
+"""
+Watching input files for changes, with inotify when available.
+"""
+import os
+import time
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+class StatWatcher(object):
+    """
+    Finds changed files by polling their modification time and size.
+    """
+
+    def __init__(self, expand, interval=0.5):
+        """
+        :param expand: function returning the list of files to watch, called
+            on every poll so new files are found
+        :param interval: seconds between polls
+        """
+        self.expand = expand
+        self.interval = interval
+        self.state = self.snapshot()
+
+    def snapshot(self):
+        """
+        :return: dict of each watched file to its (mtime, size)
+        """
+        state = {}
+        for filename in self.expand():
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            state[filename] = (stat.st_mtime_ns, stat.st_size)
+        return state
+
+    def wait(self, timeout=None):
+        """
+        Wait for files to be created, modified or deleted.
+
+        :param timeout: seconds to wait at most, forever when None
+        :return: set of changed files, empty on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            state = self.snapshot()
+            changed = {k for k in set(state) | set(self.state) if state.get(k) != self.state.get(k)}
+            self.state = state
+            if changed:
+                return changed
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return changed
+                time.sleep(min(self.interval, remaining))
+            else:
+                time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """
+    Finds changed files with inotify, watching the directories holding them
+    so files replaced by editors through a rename are still seen.
+    """
+
+    FLAGS = ('CLOSE_WRITE', 'MOVED_TO', 'MOVED_FROM', 'CREATE', 'DELETE')
+
+    def __init__(self, expand, paths):
+        """
+        :param expand: function returning the list of files to watch
+        :param paths: files and directories given to watch, directories are
+            watched even when they hold no input yet
+        """
+        self.expand = expand
+        self.paths = paths
+        self.inotify = inotify_simple.INotify()
+        self.mask = 0
+        for flag in self.FLAGS:
+            self.mask |= getattr(inotify_simple.flags, flag)
+        # watch descriptor -> directory
+        self.directories = {}
+        # normalized path -> watched file as given by expand
+        self.files = {}
+        self.update()
+
+    def update(self):
+        """
+        Watch the directories of the current inputs.
+        """
+        self.files = {os.path.normpath(filename): filename for filename in self.expand()}
+        directories = {os.path.normpath(path) for path in self.paths if os.path.isdir(path)}
+        directories.update(os.path.dirname(filename) or '.' for filename in self.files)
+        watched = set(self.directories.values())
+        for directory in directories - watched:
+            try:
+                self.directories[self.inotify.add_watch(directory, self.mask)] = directory
+            except OSError:
+                continue
+
+    def wait(self, timeout=None):
+        """
+        Wait for files to be created, modified or deleted.
+
+        :param timeout: seconds to wait at most, forever when None
+        :return: set of changed files, empty on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+            events = self.inotify.read(timeout=None if remaining is None else int(remaining * 1000))
+            before = self.files
+            self.update()
+            changed = set()
+            for event in events:
+                directory = self.directories.get(event.wd)
+                if directory is None or not event.name:
+                    continue
+                filename = os.path.normpath(os.path.join(directory, event.name))
+                if filename in self.files:
+                    changed.add(self.files[filename])
+                elif filename in before:
+                    changed.add(before[filename])
+            if changed or deadline is not None and time.monotonic() >= deadline:
+                return changed
+
+    def close(self):
+        self.inotify.close()
+
+
+def watcher(paths, expand, interval=0.5, inotify=True):
+    """
+    :param paths: files and directories given to watch
+    :param expand: function returning the list of files to watch
+    :param interval: seconds between polls of the stat fallback
+    :param inotify: use inotify when inotify_simple is installed
+    :return: InotifyWatcher, or StatWatcher as a fallback
+    """
+    if inotify and inotify_simple is not None:
+        try:
+            return InotifyWatcher(expand, paths)
+        except OSError:
+            pass
+    return StatWatcher(expand, interval)
+
+
+def debounced(watcher, delay=0.2):
+    """
+    Group bursts of changes, such as an editor saving several files, into
+    one batch once no change has been seen for delay seconds.
+
+    :param watcher: InotifyWatcher or StatWatcher
+    :param delay: seconds without changes ending a burst
+    :return: generator of (set of changed files, monotonic time the first
+        change of the burst was seen)
+    """
+    while True:
+        changed = watcher.wait()
+        first = time.monotonic()
+        while True:
+            more = watcher.wait(delay)
+            if not more:
+                break
+            changed |= more
+        yield changed, first
@@ -3,30 +3,378 @@
 Tool for generating Eve schemas from JSON.
 """
 
+import argparse
+import glob
+import json
 import os.path
 import sys
+import time
+from collections import OrderedDict
 
-from evegenie.evegenie import EveGenie
+from evegenie.categorical import CategoricalFields
+from evegenie.diff import diff
+from evegenie.evegenie import EveGenie, LIST_STRATEGIES, SIDECAR_FORMATS, settings_template
+from evegenie.formats import StringFormats
+from evegenie.mongodump import collection_name, iter_documents
+from evegenie.presence import FieldPresence
+from evegenie.ranges import NumericRanges
+from evegenie.stats import GenieStats, PHASES, ProfilerHook
+from evegenie.stream import iter_records
+from evegenie.watch import debounced, watcher
 
 
-def main(filename):
+INPUT_EXTENSIONS = ('.json', '.jsonl', '.bson')
+# json sidecars written next to settings files by earlier versions and the
+# collection metadata written by mongodump aren't inputs
+IGNORED_SUFFIXES = ('.settings.domain.json', '.metadata.json')
+# EveGenie options taking record analyzers, which collect per input and
+# so are given as a dict of their constructor's keyword arguments
+ANALYZERS = OrderedDict([
+    ('presence', FieldPresence),
+    ('categorical', CategoricalFields),
+    ('ranges', NumericRanges),
+    ('formats', StringFormats),
+])
+
+
+def genie_options(options):
+    """
+    :param options: keyword arguments for EveGenie, where analyzers may be
+        given as a dict of keyword arguments
+    :return: keyword arguments for EveGenie with new analyzers for one input
+    """
+    options = dict(options)
+    for name, analyzer in ANALYZERS.items():
+        if isinstance(options.get(name), dict):
+            options[name] = analyzer(**options[name])
+    return options
+
+
+def load(filename, jobs=None, **options):
+    """
+    Create an instance of EveGenie from a json file. A .jsonl file is read as
+    records of a single endpoint named after the file, and a .bson file
+    written by mongodump as the records of its collection.
+
+    :param filename: input filename
+    :param jobs: number of processes used to parse endpoints
+    :param options: keyword arguments passed on to EveGenie
+    :return: EveGenie instance
+    """
+    options = genie_options(options)
+    if filename.endswith('.jsonl'):
+        endpoint = os.path.splitext(os.path.basename(filename))[0]
+        options.pop('cache_dir', None)
+        with open(filename, 'r') as ifile:
+            return EveGenie(records={endpoint: iter_records(ifile)}, **options)
+    if filename.endswith('.bson'):
+        options.pop('cache_dir', None)
+        return EveGenie(records={collection_name(filename): iter_documents(filename)}, **options)
+    return EveGenie(filename=filename, workers=jobs, **options)
+
+
+def output_filename(filename):
+    """
+    :param filename: input filename
+    :return: settings filename next to the input file
+    """
+    dirname, basename = os.path.split(filename)
+    return os.path.join(dirname, '{}.settings.py'.format(basename.split('.')[0]))
+
+
+def shared_outputs(filenames):
+    """
+    Find inputs that would write the same settings file, such as users.json
+    and users.jsonl, or a.b.json and a.c.json in one directory.
+
+    :param filenames: input filenames
+    :return: dict of each input sharing its settings file -> error message
+    """
+    outputs = OrderedDict()
+    for filename in filenames:
+        outputs.setdefault(os.path.abspath(output_filename(filename)), []).append(filename)
+    errors = {}
+    for outfile, inputs in outputs.items():
+        if len(inputs) > 1:
+            for filename in inputs:
+                errors[filename] = 'ValueError: {} is the settings file of each of {}'.format(
+                    output_filename(filename), ', '.join(inputs))
+    return errors
+
+
+def main(filename, jobs=None, **options):
     """
     Create an instance of EveGenie from a json file. Then write it to file.
 
     :param filename: input filename
+    :param jobs: number of processes used to parse endpoints
+    :param options: keyword arguments passed on to EveGenie
     :return:
     """
     print('converting contents of {}'.format(filename))
-    eg = EveGenie(filename=filename)
-    outfile = '{}.settings.py'.format(filename.split('.')[0])
+    eg = load(filename, jobs=jobs, **options)
+    outfile = output_filename(filename)
     eg.write_file(outfile)
     print('settings file written to {}'.format(outfile))
+    if eg.cache is not None:
+        print(eg.cache.report())
+    if eg.stats is not None:
+        print(eg.stats.report())
+        if eg.stats.profiler is not None:
+            eg.stats.profiler.print_stats()
+
+
+def expand_inputs(paths):
+    """
+    Expand directories and glob patterns into the input files they hold.
+    Directories contribute their .json, .jsonl and .bson files, and neither
+    take sidecars or mongodump metadata.
+
+    :param paths: filenames, directories or glob patterns
+    :return: list of input filenames without duplicates, in the given order
+    """
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(os.path.join(path, name) for name in os.listdir(path)
+                             if name.endswith(INPUT_EXTENSIONS) and not name.endswith(IGNORED_SUFFIXES))
+        elif any(c in path for c in '*?['):
+            matches = sorted(match for match in glob.glob(path, recursive=True)
+                             if not match.endswith(IGNORED_SUFFIXES))
+        else:
+            matches = [path]
+        for match in matches:
+            if match not in filenames:
+                filenames.append(match)
+    return filenames
+
+
+def warm_template():
+    """
+    Compile the settings template once per process.
+    """
+    settings_template()
+
+
+def convert(filename, options):
+    """
+    Convert one input file for a batch run, timing it and catching failures.
+
+    :param filename: input filename
+    :param options: keyword arguments passed on to EveGenie
+    :return: tuple of filename, seconds taken and error message or None
+    """
+    start = time.perf_counter()
+    try:
+        load(filename, **options).write_file(output_filename(filename))
+    except Exception as e:
+        return filename, time.perf_counter() - start, '{}: {}'.format(type(e).__name__, e)
+    return filename, time.perf_counter() - start, None
+
+
+def batch(filenames, jobs=None, **options):
+    """
+    Convert many input files in one run, spreading files over a pool of
+    processes that each compile the template once. Inputs that would write
+    the same settings file fail without being converted. Prints a summary
+    of timings and failures.
+
+    :param filenames: input filenames
+    :param jobs: number of processes used to convert files
+    :param options: keyword arguments passed on to EveGenie
+    :return: number of files that failed
+    """
+    start = time.perf_counter()
+    shared = shared_outputs(filenames)
+    todo = [filename for filename in filenames if filename not in shared]
+    if jobs and jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs, initializer=warm_template) as pool:
+            converted = list(pool.map(convert, todo, [options] * len(todo)))
+    else:
+        warm_template()
+        converted = [convert(filename, options) for filename in todo]
+    converted = {result[0]: result for result in converted}
+    results = [converted.get(filename) or (filename, 0.0, shared[filename]) for filename in filenames]
+
+    failures = 0
+    for filename, seconds, error in results:
+        print('{:8.3f}s  {}  {}'.format(seconds, 'FAIL' if error else 'ok  ', filename))
+        if error:
+            failures += 1
+            print('           {}'.format(error))
+    print('{} files converted, {} failed in {:.3f}s'.format(
+        len(results) - failures, failures, time.perf_counter() - start))
+    return failures
+
+
+def compare(old_filename, new_filename, jobs=None, as_json=False, **options):
+    """
+    Print the structural diff of the schemas inferred from two inputs.
+
+    :param old_filename: input the schemas are compared from
+    :param new_filename: input the schemas are compared to
+    :param jobs: number of processes used to parse endpoints
+    :param as_json: print the diff as json instead of a summary
+    :param options: keyword arguments passed on to EveGenie
+    :return: True when the schemas differ
+    """
+    result = diff(load(old_filename, jobs=jobs, **options), load(new_filename, jobs=jobs, **options))
+    print(json.dumps(result.as_dict(), indent=4) if as_json else result.report())
+    return bool(result)
+
+
+def watch(paths, jobs=None, delay=0.2, interval=0.5, inotify=True, **options):
+    """
+    Convert the inputs, then keep converting them again as they change
+    until interrupted. Each json input keeps its EveGenie in memory, so
+    only its changed endpoints are parsed and formatted again. Prints the
+    time taken to regenerate each file and the latency since the change
+    was first seen. Inputs sharing their settings file with another input
+    fail, as in batch.
+
+    :param paths: filenames, directories or glob patterns
+    :param jobs: number of processes used to parse endpoints
+    :param delay: seconds without changes that end a burst of changes
+    :param interval: seconds between polls when inotify isn't available
+    :param inotify: use inotify when inotify_simple is installed
+    :param options: keyword arguments passed on to EveGenie
+    :return:
+    """
+    genies = {}
+
+    def regenerate(filename):
+        start = time.perf_counter()
+        shared = shared_outputs(expand()).get(filename)
+        if shared is not None:
+            print('{:8.3f}s  FAIL  {}'.format(time.perf_counter() - start, filename))
+            print('           {}'.format(shared))
+            return
+        try:
+            if filename.endswith(('.jsonl', '.bson')):
+                eg = load(filename, **options)
+                changed = list(eg.endpoints)
+            else:
+                eg = genies.get(filename) or EveGenie(data={}, workers=jobs, **genie_options(options))
+                changed = eg.refresh(filename)
+            if changed:
+                eg.write_file(output_filename(filename))
+        except Exception as e:
+            print('{:8.3f}s  FAIL  {}'.format(time.perf_counter() - start, filename))
+            print('           {}: {}'.format(type(e).__name__, e))
+            return
+        genies[filename] = eg
+        print('{:8.3f}s  ok    {}  {} endpoints regenerated'.format(
+            time.perf_counter() - start, filename, len(changed)))
+
+    def expand():
+        return expand_inputs(paths)
+
+    for filename in expand():
+        regenerate(filename)
+
+    files = watcher(paths, expand, interval=interval, inotify=inotify)
+    print('watching for changes with {}, press Ctrl-C to stop'.format(type(files).__name__))
+    try:
+        for changed, first in debounced(files, delay):
+            for filename in sorted(changed):
+                if os.path.isfile(filename):
+                    regenerate(filename)
+                elif genies.pop(filename, None) is not None:
+                    print('          gone  {}'.format(filename))
+            print('latency {:.3f}s since the first change'.format(time.monotonic() - first))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        files.close()
 
 
 if __name__ == '__main__':
-    if len(sys.argv) >= 2:
-        filename = sys.argv[1]
-        if os.path.isfile(filename):
-            main(filename)
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('filenames', nargs='+', metavar='filename',
+                        help='json files, directories or glob patterns to generate settings from')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='work in parallel with this many processes, over files when '
+                             'converting several and over endpoints otherwise')
+    parser.add_argument('--list-sample', type=int, default=None,
+                        help='infer list schemas from at most this many items')
+    parser.add_argument('--list-strategy', choices=LIST_STRATEGIES, default='first',
+                        help='how list items are sampled')
+    parser.add_argument('--cache', metavar='DIR', default=None,
+                        help='reuse endpoints whose source is unchanged since the last run')
+    parser.add_argument('--share-shapes', action='store_true',
+                        help='write nested schemas repeated in the output once, as variables')
+    parser.add_argument('--sidecar', choices=SIDECAR_FORMATS, default=None,
+                        help='write DOMAIN to a file in this format, loaded by settings on first use')
+    parser.add_argument('--presence', action='store_true',
+                        help='set required, nullable and empty from how often fields of '
+                             '.jsonl and .bson records are present, null or empty')
+    parser.add_argument('--required-ratio', type=float, default=1.0,
+                        help='share of records a field must be in to be required')
+    parser.add_argument('--nullable-ratio', type=float, default=0.0,
+                        help='share of null values above which a field is nullable')
+    parser.add_argument('--empty-ratio', type=float, default=0.0,
+                        help='share of empty values up to which a field is marked non-empty')
+    parser.add_argument('--categorical', action='store_true',
+                        help='set allowed on string fields of .jsonl and .bson records '
+                             'taking few distinct values')
+    parser.add_argument('--max-categories', type=int, default=20,
+                        help='most distinct values of a field marked categorical')
+    parser.add_argument('--ranges', action='store_true',
+                        help='set min and max on numeric fields of .jsonl and .bson records')
+    parser.add_argument('--clip-percentiles', type=float, nargs=2, metavar=('LOW', 'HIGH'), default=None,
+                        help='use these percentiles of the numbers as --ranges bounds, such as 1 99')
+    parser.add_argument('--formats', action='store_true',
+                        help='make string fields of .jsonl and .bson records holding RFC 1123 datetimes or '
+                             'objectids of that type, and set regex on fields of uuids, emails, urls or '
+                             'ISO 8601 dates')
+    parser.add_argument('--format-threshold', type=float, default=0.95,
+                        help='share of sampled strings of a field that must be in a --formats format')
+    parser.add_argument('--diff', action='store_true',
+                        help='compare the schemas of two inputs instead of writing settings')
+    parser.add_argument('--json', action='store_true',
+                        help='print --diff output as json')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep regenerating settings as the inputs change')
+    parser.add_argument('--stats', action='store_true',
+                        help='print time per phase and node counts, depth and peak memory per endpoint')
+    parser.add_argument('--profile', metavar='PHASE', action='append', choices=PHASES,
+                        help='profile a phase with cProfile, implies --stats')
+    args = parser.parse_args()
+
+    options = dict(list_sample=args.list_sample, list_strategy=args.list_strategy,
+                   cache_dir=args.cache, share_shapes=args.share_shapes,
+                   sidecar=args.sidecar)
+    if args.presence:
+        options['presence'] = dict(required=args.required_ratio, nullable=args.nullable_ratio,
+                                   empty=args.empty_ratio)
+    if args.categorical:
+        options['categorical'] = dict(max_values=args.max_categories)
+    if args.ranges or args.clip_percentiles:
+        options['ranges'] = dict(percentiles=args.clip_percentiles)
+    if args.formats:
+        options['formats'] = dict(threshold=args.format_threshold)
+    filenames = expand_inputs(args.filenames)
+    if (args.stats or args.profile) and (args.diff or args.watch or args.filenames != filenames or len(filenames) != 1):
+        parser.error('--stats and --profile take a single input file, without --diff or --watch')
+
+    if args.diff:
+        if len(args.filenames) != 2:
+            parser.error('--diff takes two input files')
+        sys.exit(1 if compare(*args.filenames, jobs=args.jobs, as_json=args.json, **options) else 0)
+    if args.watch:
+        watch(args.filenames, jobs=args.jobs, **options)
+        sys.exit(0)
+    if len(filenames) == 1 and args.filenames == filenames:
+        if args.stats or args.profile:
+            profiler = ProfilerHook(args.profile) if args.profile else None
+            options['stats'] = GenieStats(memory=True, profiler=profiler)
+        if os.path.isfile(filenames[0]):
+            main(filenames[0], jobs=args.jobs, **options)
         else:
             print('file does not exist')
+    elif not filenames:
+        print('no input files found')
+        sys.exit(1)
+    else:
+        sys.exit(1 if batch(filenames, jobs=args.jobs, **options) else 0)
@@ -4,17 +4,49 @@
 Tests for geneve tool.
 """
 
+import asyncio
+import contextlib
+import datetime
+import http.client
+import io
 import json
 import os
+import random
+import subprocess
 import sys
+import tempfile
+import threading
+import time
+import types
 import pytest
 from collections import deque, OrderedDict
 from eve.io.mongo import Validator
+from eve.utils import str_to_date
 
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(parent_dir)
 
+import geneve
 from evegenie import EveGenie
+from evegenie.categorical import CategoricalFields
+from evegenie.classify import classify_string
+from evegenie.diff import diff
+from evegenie.emitter import write_literal
+from evegenie.fields import RecordWalker
+from evegenie.formats import StringFormats, detect_format
+from evegenie.mongodump import iter_documents
+from evegenie.node import SchemaNode, from_dict, to_dict
+from evegenie.presence import FieldPresence
+from evegenie.ranges import NumericRanges
+from evegenie.server import SchemaServer
+from evegenie.stats import GenieStats
+from evegenie.stream import iter_endpoints, iter_records
+from evegenie.validate import compile_validator, validate_many
+from evegenie.watch import StatWatcher, debounced
+
+# seconds geneve.py may take to convert a small file beyond starting python,
+# twice the budget benchmarks/bench_settings_import.py checks
+COLD_START_BUDGET = 1.0
 
 
 test_data = OrderedDict([
@@ -224,6 +256,420 @@ def test_input_file():
     assert(OrderedDict(eg) == test_data_answer)
 
 
+def test_input_file_stream():
+    """
+    Make sure data streamed from file is parsed as expected.
+
+    :return:
+    """
+    eg = EveGenie(filename=parent_dir + '/tests/test.json', stream=True)
+    assert(OrderedDict(eg) == test_data_answer)
+
+
+def test_iter_endpoints_small_chunks():
+    """
+    Make sure endpoints split across many read chunks are decoded intact.
+
+    :return:
+    """
+    ifile = io.StringIO(json.dumps(test_data, indent=2))
+    endpoints = OrderedDict(iter_endpoints(ifile, chunk_size=7))
+    assert(endpoints == test_data)
+    assert(list(endpoints) == list(test_data))
+
+
+def test_iter_endpoints_malformed():
+    """
+    Make sure malformed separators between endpoints report what was found.
+
+    :return:
+    """
+    for text, found in (('{"a": {}', "''"), ('{"a": {} "b": {}}', "'\"'"), ('{"a": {}]', "']'")):
+        with pytest.raises(ValueError) as error:
+            list(iter_endpoints(io.StringIO(text)))
+        assert(str(error.value) == "Expected ',' or '}' in JSON input, found " + found)
+
+
+def test_input_workers():
+    """
+    Make sure endpoints parsed in a process pool match the serial result and
+    keep the input order.
+
+    :return:
+    """
+    eg = EveGenie(data=test_data, workers=2)
+    assert(OrderedDict(eg) == test_data_answer)
+    assert(list(eg.endpoints) == list(test_data_answer))
+
+
+def test_input_records():
+    """
+    Make sure many records of an endpoint are folded into one schema.
+
+    :return:
+    """
+    records = [
+        OrderedDict([('name', 'Star'), ('power', 1), ('tags', [])]),
+        OrderedDict([('name', None), ('power', 2.5), ('tags', ['a'])]),
+        OrderedDict([('name', 'Mushroom'), ('duration', 10), ('tags', [1])]),
+    ]
+    eg = EveGenie(records={'power-up': iter(records)})
+    assert(eg['power-up']['schema'] == OrderedDict([
+        ('name', OrderedDict([('type', 'string'), ('nullable', True)])),
+        ('power', OrderedDict([('type', 'float')])),
+        ('tags', OrderedDict([
+            ('type', 'list'),
+            ('schema', OrderedDict([('type', ['string', 'integer'])])),
+        ])),
+        ('duration', OrderedDict([('type', 'integer')])),
+    ]))
+
+
+def test_input_records_jsonl():
+    """
+    Make sure records read from JSON lines match the single example schema.
+
+    :return:
+    """
+    ifile = io.StringIO('\n'.join(json.dumps(test_data['artifact']) for _ in range(3)))
+    eg = EveGenie(records={'artifact': iter_records(ifile)})
+    assert(eg['artifact'] == test_data_answer['artifact'])
+
+
+def test_cold_start():
+    """
+    Tests that importing geneve doesn't import modules only some runs need,
+    that converting a small file stays within a cold start budget beyond
+    starting python, and that the template bytecode cache is only written
+    where it is set. The fastest of a few runs is kept, so a busy machine
+    doesn't fail the test.
+
+    :return:
+    """
+    script = 'import sys, geneve; print(" ".join(sorted(sys.modules)))'
+    modules = subprocess.check_output([sys.executable, '-c', script], cwd=parent_dir).decode().split()
+    for module in ('jinja2', 'concurrent.futures.process', 'bson', 'cProfile', 'tracemalloc', 'tempfile'):
+        assert(module not in modules)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, EVEGENIE_TEMPLATE_CACHE=os.path.join(tmp, 'templates'))
+        filename = os.path.join(tmp, 'small.json')
+        with open(filename, 'w') as ofile:
+            json.dump(simple_test_data, ofile)
+        subprocess.check_call([sys.executable, 'geneve.py', filename], cwd=parent_dir, stdout=subprocess.DEVNULL,
+                              env=env)
+        assert(os.path.isfile(os.path.join(tmp, 'small.settings.py')))
+        assert(os.listdir(os.path.join(tmp, 'templates')))
+
+        env.pop('EVEGENIE_TEMPLATE_CACHE')
+
+        def fastest_run(args):
+            times = []
+            for _ in range(3):
+                start = time.perf_counter()
+                subprocess.check_call([sys.executable] + args, cwd=parent_dir, stdout=subprocess.DEVNULL, env=env)
+                times.append(time.perf_counter() - start)
+            return min(times)
+
+        assert(fastest_run(['geneve.py', filename]) - fastest_run(['-c', 'pass']) < COLD_START_BUDGET)
+
+
+def test_input_bson():
+    """
+    Test reading the records of a collection from a mongodump .bson file.
+
+    :return:
+    """
+    bson = pytest.importorskip('bson')
+    documents = [
+        OrderedDict([('_id', bson.ObjectId()), ('name', 'Sword'), ('count', bson.Int64(2 ** 40)),
+                     ('price', bson.Decimal128('9.99')), ('made', datetime.datetime(2020, 1, 1)),
+                     ('tags', ['a', 'b']), ('owner', OrderedDict([('name', 'Bob'), ('level', 3)]))]),
+        OrderedDict([('_id', bson.ObjectId()), ('name', 'Shield'), ('count', 1.5), ('blob', b'\x00'),
+                     ('tags', []), ('owner', None)]),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'items.bson')
+        with open(filename, 'wb') as ofile:
+            for document in documents:
+                ofile.write(bson.encode(document))
+
+        read = list(iter_documents(filename))
+        assert(read[0]['made'] == datetime.datetime(2020, 1, 1))
+        assert(read[0]['tags'] == ['a', 'b'] and read[1]['owner'] is None)
+        assert(bytes(read[0]['_id']) == documents[0]['_id'].binary)
+
+        eg = geneve.load(filename)
+    schema = eg['items']['schema']
+    assert(list(eg.endpoints) == ['items'])
+    assert(schema['_id'] == OrderedDict([('type', 'objectid')]))
+    assert(schema['count'] == OrderedDict([('type', 'float')]))
+    assert(schema['price'] == OrderedDict([('type', 'decimal')]))
+    assert(schema['made'] == OrderedDict([('type', 'datetime')]))
+    assert(schema['blob'] == OrderedDict([('type', 'binary')]))
+    assert(schema['owner']['nullable'] is True)
+    assert(schema['owner']['schema']['level'] == OrderedDict([('type', 'integer')]))
+
+
+def test_records_presence():
+    """
+    Test that field presence counts of records set required, nullable and
+    empty according to the thresholds.
+
+    :return:
+    """
+    records = [
+        OrderedDict([('name', 'Sword'), ('note', None), ('tags', ['a']), ('owner', OrderedDict([('id', 1)]))]),
+        OrderedDict([('name', 'Shield'), ('note', 'old'), ('tags', []), ('owner', OrderedDict())]),
+        OrderedDict([('name', ''), ('tags', ['b', None]), ('owner', OrderedDict([('id', 2)]))]),
+    ]
+    eg = EveGenie(records={'artifact': records}, presence=True)
+    schema = eg['artifact']['schema']
+    assert(schema['name'] == OrderedDict([('type', 'string'), ('required', True)]))
+    assert(schema['note'] == OrderedDict([('type', 'string'), ('nullable', True), ('empty', False)]))
+    assert(schema['tags']['schema'] == OrderedDict([('type', 'string'), ('nullable', True), ('empty', False)]))
+    assert('empty' not in schema['tags'])
+    assert(schema['owner']['schema']['id'] == OrderedDict([('type', 'integer')]))
+    counters = eg.presence.endpoints['artifact'].fields
+    assert((counters[('note',)].present, counters[('note',)].null) == (2, 1))
+    assert(counters[('tags', '[]')].types == {'string': 2, 'null': 1})
+
+    presence = FieldPresence(required=0.6, nullable=0.5, empty=0.4)
+    schema = EveGenie(records={'artifact': records}, presence=presence)['artifact']['schema']
+    assert(schema['name'] == OrderedDict([('type', 'string'), ('required', True), ('empty', False)]))
+    assert(schema['note'] == OrderedDict([('type', 'string'), ('required', True), ('empty', False)]))
+    assert(schema['owner']['schema']['id']['required'] is True)
+    assert(len(presence.endpoints['artifact'].fields) == 6)
+
+
+def test_records_categorical():
+    """
+    Test that string fields of records taking few distinct values get
+    allowed, and that fields past the cap of distinct values stop being
+    tracked.
+
+    :return:
+    """
+    records = [OrderedDict([('color', ['red', 'blue', 'green'][i % 3]), ('name', 'item {}'.format(i)),
+                            ('tags', ['a', 'b'][:i % 3]), ('stats', OrderedDict([('size', 'S' if i % 2 else 'L')])),
+                            ('bonus', '1-10')])
+               for i in range(30)]
+    eg = EveGenie(records={'artifact': records}, categorical=True)
+    schema = eg['artifact']['schema']
+    assert(schema['color'] == OrderedDict([('type', 'string'), ('allowed', ['blue', 'green', 'red'])]))
+    assert('allowed' not in schema['name'])
+    assert(schema['tags']['schema']['allowed'] == ['a', 'b'])
+    assert(schema['stats']['schema']['size']['allowed'] == ['L', 'S'])
+    assert('allowed' not in schema['bonus'])
+    name = eg.categorical.endpoints['artifact'].fields[('name',)]
+    assert(name.overflowed and name.count == 21)
+    v = Validator(schema)
+    assert(not v.validate(OrderedDict([('color', 'pink')])))
+    assert(eg.validator('artifact')(OrderedDict([('color', 'pink')])) == v.errors)
+
+    categorical = CategoricalFields(max_values=2, min_count=40)
+    schema = EveGenie(records={'artifact': records}, categorical=categorical)['artifact']['schema']
+    assert(all('allowed' not in v for v in schema.values()))
+
+
+def test_records_ranges():
+    """
+    Test that numbers of records set min and max across batches, with and
+    without numpy, and that percentiles clip outliers.
+
+    :return:
+    """
+    records = [OrderedDict([('level', i % 50), ('weight', i / 4.0), ('alive', True),
+                            ('scores', [i, -i]), ('stats', OrderedDict([('speed', float(i % 7))])),
+                            ('bonus', '1-10')])
+               for i in range(1000)]
+    records[10]['level'] = 10 ** 30
+    records[11]['weight'] = float('nan')
+    expected = None
+    for use_numpy in (None, False):
+        eg = EveGenie(records={'artifact': records}, ranges=NumericRanges(batch_size=64, use_numpy=use_numpy))
+        schema = eg['artifact']['schema']
+        assert(schema['level'] == OrderedDict([('type', 'integer'), ('min', 0), ('max', 10 ** 30)]))
+        assert(schema['weight'] == OrderedDict([('type', 'float'), ('min', 0.0), ('max', 249.75)]))
+        assert(schema['alive'] == OrderedDict([('type', 'boolean')]))
+        assert((schema['scores']['schema']['min'], schema['scores']['schema']['max']) == (-999, 999))
+        assert(schema['bonus'] == OrderedDict([('type', 'integer'), ('min', 1), ('max', 10)]))
+        assert(eg.ranges.endpoints['artifact'].fields[('stats', 'speed')].count == 1000)
+        assert(expected is None or schema == expected)
+        expected = schema
+
+    ranges = NumericRanges(percentiles=(5, 95), sample_size=500)
+    schema = EveGenie(records={'artifact': records}, ranges=ranges)['artifact']['schema']
+    assert(schema['level']['max'] < 50)
+    assert(150 < schema['weight']['max'] < 249.75)
+
+    # the reservoir copes with random() returning 0.0
+    ranges = NumericRanges(percentiles=(5, 95), sample_size=10)
+    endpoint = ranges.endpoint('artifact')
+    endpoint.random.random = lambda: 0.0
+    walker = RecordWalker([endpoint])
+    for record in records:
+        walker.walk(record)
+    endpoint.flush()
+    assert(len(endpoint.fields[('level',)].sample) == 10)
+
+
+def test_records_formats():
+    """
+    Test that string fields of records in a format get its type or regex,
+    that the threshold allows some strings of other formats, that Eve
+    accepts the records once it parsed their dates, and that compiled
+    validators check the regex like Eve's Validator.
+
+    :return:
+    """
+    records = [OrderedDict([('created', '2020-01-{:02d}T10:00:00Z'.format(i % 28 + 1)),
+                            ('updated', 'Tue, 02 Apr 2013 10:29:{:02d} GMT'.format(i % 60)),
+                            ('owner', '{:024x}'.format(i)),
+                            ('key', '123e4567-e89b-12d3-a456-{:012x}'.format(i)),
+                            ('contact', OrderedDict([('email', 'user{}@example.com'.format(i))])),
+                            ('links', ['https://example.com/{}'.format(i)]),
+                            ('name', 'item {}'.format(i)),
+                            ('ref', 'objectid:owners')])
+               for i in range(2000)]
+    records[5]['created'] = 'unknown'
+    eg = EveGenie(records={'artifact': records}, formats=StringFormats(batch_size=64, sample_size=500))
+    schema = eg['artifact']['schema']
+    # Eve only parses dates in its RFC 1123 DATE_FORMAT
+    assert(schema['created']['type'] == 'string' and schema['created']['regex'].startswith(r'\d{4}-'))
+    assert(schema['updated'] == OrderedDict([('type', 'datetime')]))
+    assert(schema['owner'] == OrderedDict([('type', 'objectid')]))
+    assert(schema['key']['regex'].startswith('[0-9a-fA-F]{8}-'))
+    assert('regex' in schema['contact']['schema']['email'])
+    assert(schema['links']['schema']['type'] == 'string' and 'regex' in schema['links']['schema'])
+    assert(schema['name'] == OrderedDict([('type', 'string')]))
+    assert(schema['ref']['data_relation']['resource'] == 'owners')
+    key = eg.formats.endpoints['artifact'].fields[('key',)]
+    assert(key.count == 2000 and 500 <= key.sampled < 2000 and key.formats['uuid'] == key.sampled)
+
+    v = Validator(schema)
+    document = OrderedDict((k, v) for k, v in records[7].items() if k != 'ref')
+    document['updated'] = str_to_date(document['updated'])
+    assert(v.validate(document))
+    for document in (OrderedDict([('key', 'abc'), ('contact', {'email': 'nobody'})]), records[0]):
+        v.validate(document)
+        assert(eg.validator('artifact')(document) == v.errors)
+
+    schema = EveGenie(records={'artifact': records}, formats=StringFormats(threshold=1.0))['artifact']['schema']
+    assert(schema['created'] == OrderedDict([('type', 'string')]))
+    assert(schema['updated'] == OrderedDict([('type', 'datetime')]))
+    schema = EveGenie(records={'artifact': records}, formats=StringFormats(formats=('uuid',)))['artifact']['schema']
+    assert(schema['owner']['type'] == 'string' and 'regex' in schema['key'])
+    with pytest.raises(ValueError):
+        StringFormats(formats=('phone',))
+
+    assert(detect_format('2020-02-29') == 'iso8601')
+    assert(detect_format('2020-02-30') is None)
+    assert(detect_format('Tue, 31 Apr 2013 10:29:13 GMT') is None)
+    assert(detect_format('http://example.com') == 'url')
+    assert(detect_format('hello@example') is None)
+
+
+def test_list_mixed_types():
+    """
+    Make sure every item of a list contributes to the list schema.
+
+    :return:
+    """
+    eg = EveGenie(data=OrderedDict([('bag', OrderedDict([('items', [1, 'two', None, 3.0])]))]))
+    assert(eg['bag']['schema']['items'] == OrderedDict([
+        ('type', 'list'),
+        ('schema', OrderedDict([('type', ['float', 'string']), ('nullable', True)])),
+    ]))
+
+
+def test_list_sample_strategies():
+    """
+    Make sure each list sampling strategy is bounded by the sample size.
+
+    :return:
+    """
+    values = list(range(1000))
+    for strategy in ('first', 'stride', 'reservoir'):
+        eg = EveGenie(data=simple_test_data, list_sample=10, list_strategy=strategy)
+        sample = eg.sample_list(values)
+        assert(0 < len(sample) <= 10)
+        assert(set(sample) <= set(values))
+        assert(to_dict(eg.parse_item(values)) == OrderedDict([
+            ('type', 'list'),
+            ('schema', OrderedDict([('type', 'integer')])),
+        ]))
+
+
+def test_list_sample_reservoir_zero(monkeypatch):
+    """
+    Make sure reservoir sampling copes with random() returning 0.0.
+
+    :return:
+    """
+    monkeypatch.setattr(random.Random, 'random', lambda self: 0.0)
+    eg = EveGenie(data=simple_test_data, list_sample=10, list_strategy='reservoir')
+    assert(len(eg.sample_list(list(range(1000)))) == 10)
+
+
+def test_list_sample_bad_strategy():
+    """
+    Test that an unknown list sampling strategy errors.
+
+    :return:
+    """
+    with pytest.raises(ValueError):
+        EveGenie(data=simple_test_data, list_strategy='last')
+
+
+def test_input_lazy():
+    """
+    Make sure lazy endpoints are parsed on first access only, while length
+    and order are known up front.
+
+    :return:
+    """
+    eg = EveGenie(data=json.dumps(test_data), lazy=True)
+    assert(len(eg) == 3)
+    assert(list(eg.endpoints) == list(test_data_answer))
+    assert('artifact' in eg.endpoints and 'missing' not in eg.endpoints)
+    assert(eg.endpoints.parsed == {})
+
+    assert(eg['artifact'] == test_data_answer['artifact'])
+    assert(list(eg.endpoints.parsed) == ['artifact'])
+    assert(eg.endpoints['artifact'] is eg.endpoints['artifact'])
+    assert(OrderedDict(eg) == test_data_answer)
+
+    # streamed and record sources would all be read into memory up front
+    with pytest.raises(ValueError):
+        EveGenie(records={'power-up': iter([test_data['power-up']])}, lazy=True)
+    with pytest.raises(ValueError):
+        EveGenie(filename='test.json', stream=True, lazy=True)
+
+
+def test_endpoint_lookups():
+    """
+    Make sure endpoint lookups convert each endpoint once, and that settings
+    assigned back replace the endpoint's schema and output.
+
+    :return:
+    """
+    eg = EveGenie(data=json.dumps(test_data))
+    settings = eg['artifact']
+    assert(settings == test_data_answer['artifact'])
+    assert(eg['artifact'] is settings)
+    assert(isinstance(eg.endpoints['artifact'], SchemaNode))
+
+    changed = json.loads(json.dumps(settings), object_pairs_hook=OrderedDict)
+    changed['schema']['name']['required'] = True
+    eg['artifact'] = changed
+    assert(eg['artifact'] == changed)
+    assert(eg.endpoints['artifact'].schema['name'].required is True)
+    output = io.StringIO()
+    eg.render(output)
+    assert("'required': True" in output.getvalue())
+
+
 def test_input_both_inputs():
     """
     Make sure when both data types are passed the data is still parsed as expected.
@@ -258,6 +704,27 @@ def test_endpoint_format():
     assert(eg.format_endpoint(endpoint) == format_endpoint_test)
 
 
+def test_endpoint_format_literals():
+    """
+    Test that formatted endpoints are valid Python that evaluates back to
+    the schema, even for strings that look like json keywords or quotes.
+
+    :return:
+    """
+    schema = OrderedDict([
+        ('schema', OrderedDict([
+            ('it\'s "true"', OrderedDict([('type', ['string', 'float']), ('nullable', True)])),
+            ('false', OrderedDict([('allow_unknown', False)])),
+            ('☃', OrderedDict([('type', 'float'), ('min', -1.5), ('max', 1e20)])),
+            ('empty', OrderedDict([('type', 'list'), ('schema', OrderedDict())])),
+        ])),
+    ])
+    eg = EveGenie(data=simple_test_data)
+    endpoint = eg.format_endpoint(schema)
+    assert(eval(endpoint) == schema)
+    assert(endpoint.isascii())
+
+
 def test_output_file():
     """
     Tests writing schema to file and compares the files output to a control.
@@ -279,6 +746,426 @@ def test_output_file():
     assert(test_schema == control)
 
 
+def test_shared_shapes():
+    """
+    Tests that equal sub-schemas share one node, and that repeated shapes
+    written once as variables give the same settings.
+
+    :return:
+    """
+    filename = parent_dir + '/tests/testrecursion.json'
+    eg = EveGenie(filename=filename, share_shapes=True)
+    schema = eg.endpoints['testentity'].schema
+    assert(schema['object'].schema['a'] is schema['string'])
+    assert(schema['array1'] is schema['embedded1'].schema['array1'])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        domains = []
+        for genie in (EveGenie(filename=filename), eg):
+            outfile = os.path.join(tmp, 'settings.py')
+            genie.write_file(outfile)
+            with open(outfile, 'r') as ifile:
+                text = ifile.read()
+            settings = {}
+            exec(compile(text, outfile, 'exec'), settings)
+            domains.append((len(text), settings['DOMAIN']))
+    assert(domains[1][0] < domains[0][0])
+    assert(domains[1][1] == domains[0][1])
+    assert('array1_schema' in settings)
+
+
+def test_output_sidecar():
+    """
+    Tests that settings loading DOMAIN from a sidecar give the same DOMAIN
+    as settings holding it, and only load it when it is used.
+
+    :return:
+    """
+    eg = EveGenie(data=test_data)
+    for sidecar in ('marshal', 'pickle', 'json'):
+        with tempfile.TemporaryDirectory() as tmp:
+            outfile = os.path.join(tmp, 'settings.py')
+            EveGenie(data=test_data, sidecar=sidecar).write_file(outfile)
+            assert(os.path.isfile(os.path.join(tmp, 'settings.domain-' + sidecar)))
+
+            settings = types.ModuleType('config')
+            settings.__file__ = outfile
+            with open(outfile, 'r') as ifile:
+                exec(compile(ifile.read(), outfile, 'exec'), settings.__dict__)
+            assert('DOMAIN' not in settings.__dict__)
+            assert('DOMAIN' in dir(settings))
+            assert(settings.DOMAIN == dict(eg))
+            assert(settings.DOMAIN is settings.DOMAIN)
+
+    with pytest.raises(ValueError):
+        EveGenie(data=test_data, sidecar='yaml')
+
+
+def test_refresh():
+    """
+    Tests that refreshing from a changed file only parses the changed
+    endpoints and keeps the others.
+
+    :return:
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'input.json')
+        with open(filename, 'w') as ofile:
+            json.dump(test_data, ofile)
+        eg = EveGenie(data={})
+        assert(eg.refresh(filename) == ['user', 'artifact', 'power-up'])
+        assert(OrderedDict(eg) == test_data_answer)
+        user = eg.endpoints['user']
+
+        changed = OrderedDict(test_data)
+        changed['artifact'] = OrderedDict([('name', 'Cup')])
+        del changed['power-up']
+        with open(filename, 'w') as ofile:
+            json.dump(changed, ofile)
+        assert(eg.refresh(filename) == ['artifact', 'power-up'])
+        assert(eg.endpoints['user'] is user)
+        assert(list(eg.endpoints) == ['user', 'artifact'])
+        assert(eg['artifact'] == EveGenie(data=changed)['artifact'])
+        assert(eg.refresh(filename) == [])
+
+        # nodes of replaced endpoints aren't kept
+        previous = EveGenie(data=changed)
+        for i in range(20):
+            changed['artifact'] = OrderedDict([('name{}'.format(i), OrderedDict([('size', i)]))])
+            with open(filename, 'w') as ofile:
+                json.dump(changed, ofile)
+            assert(eg.refresh(filename) == ['artifact'])
+            assert(diff(previous, eg))
+        assert(len(eg.hashes) <= len(eg.shapes) + len(eg.endpoints))
+        assert(len(eg.shapes) == len(EveGenie(data=changed).shapes))
+        assert(OrderedDict(eg) == OrderedDict(EveGenie(data=changed)))
+
+
+def test_diff():
+    """
+    Tests that diffs list added, removed, retyped and changed fields and
+    skip unchanged endpoints and subtrees by their hashes.
+
+    :return:
+    """
+    old = EveGenie(data=test_data)
+    changed = json.loads(json.dumps(test_data), object_pairs_hook=OrderedDict)
+    changed['user']['name'] = 5
+    changed['user']['inventory'].append(1)
+    del changed['user']['age']
+    changed['user']['address']['zip'] = 12345
+    changed['user']['attack_bonus'] = '1-20'
+    changed['user']['level'] = 3
+    del changed['artifact']
+    changed['item'] = {'name': 'Cup'}
+    new = EveGenie(data=changed)
+
+    result = diff(old, new)
+    assert(result.added_endpoints == ['item'])
+    assert(result.removed_endpoints == ['artifact'])
+    assert(list(result.endpoints) == ['user'])
+    user = result.endpoints['user']
+    assert(user['added'] == [('address.zip', 'integer'), ('level', 'integer')])
+    assert(user['removed'] == [('age', 'integer')])
+    assert(user['retyped'] == [('inventory[]', 'string', ['string', 'integer']), ('name', 'string', 'integer')])
+    assert(user['changed'] == [('attack_bonus', 'max', 10, 20)])
+    assert('power-up' not in result.endpoints)
+    assert(not diff(old, EveGenie(data=test_data)))
+    assert(diff(old, old).report() == 'no differences')
+    json.dumps(result.as_dict())
+
+    # list items or dict fields seen on one side only
+    empty = EveGenie(data={'e': {'l': [], 'd': {}}})
+    filled = EveGenie(data={'e': {'l': [1], 'd': {'a': 'x'}}})
+    changes = diff(empty, filled).endpoints['e']
+    assert(changes['added'] == [('d.a', 'string'), ('l[]', 'integer')])
+    assert(diff(filled, empty).endpoints['e']['removed'] == [('d.a', 'string'), ('l[]', 'integer')])
+
+
+def test_compiled_validator():
+    """
+    Tests that compiled validators report the same errors as Eve's
+    Validator, for valid and broken documents and presence rules.
+
+    :return:
+    """
+    records = []
+    for i in range(20):
+        record = OrderedDict([('name', 'n{}'.format(i)), ('age', i if i % 7 else None),
+                              ('tags', ['a'] if i % 3 else []), ('address', {'city': 'c', 'zip': i})])
+        if i % 4:
+            record['bonus'] = '1-10'
+        records.append(record)
+    eg = EveGenie(records={'people': iter(records)}, presence=True)
+    schema = eg['people']['schema']
+    broken = [
+        OrderedDict([('age', 'old'), ('tags', [1, None, 'b']), ('address', {'city': '', 'street': 1})]),
+        OrderedDict([('name', None), ('age', 3), ('tags', 'a'), ('address', [1]), ('bonus', 11)]),
+        OrderedDict([('name', ''), ('age', True), ('tags', []), ('address', None), ('bonus', 0), ('x', 1)]),
+        OrderedDict([('name', 'n'), ('age', 2.5), ('tags', ['a', []]), ('address', {'zip': '1'}), ('bonus', 'z')]),
+    ]
+    validate = eg.validator('people')
+    for allow_unknown in (False, True):
+        v = Validator(schema, allow_unknown=allow_unknown)
+        check = compile_validator(schema, allow_unknown=allow_unknown)
+        for document in records + broken:
+            v.validate(document)
+            assert(check(document) == v.errors)
+    assert(validate(records[0]) == {})
+    assert(validate(broken[0])['address'] == {'city': 'empty values not allowed', 'street': 'unknown field',
+                                            'zip': 'required field'})
+
+    documents = records + broken
+    expected = [(i, validate(d)) for i, d in enumerate(documents) if validate(d)]
+    assert(list(validate_many(schema, documents, workers=0)) == expected)
+    assert(list(validate_many(schema, documents, workers=2, chunk_size=3)) == expected)
+    with pytest.raises(ValueError):
+        compile_validator({'name': {'minlength': 1}})
+
+
+def test_watch_changes():
+    """
+    Tests that polling finds changed, new and deleted files, and that
+    bursts of changes are grouped.
+
+    :return:
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        first, second = os.path.join(tmp, 'a.json'), os.path.join(tmp, 'b.json')
+        with open(first, 'w') as ofile:
+            ofile.write('{}')
+        files = StatWatcher(lambda: geneve.expand_inputs([tmp]), interval=0.01)
+        assert(files.wait(0.05) == set())
+
+        with open(first, 'w') as ofile:
+            ofile.write('{"a": {}}')
+        with open(second, 'w') as ofile:
+            ofile.write('{}')
+        changed, _ = next(debounced(files, 0.05))
+        assert(changed == {first, second})
+
+        os.remove(second)
+        assert(files.wait(1) == {second})
+
+
+def test_server():
+    """
+    Tests that the service renders settings and schemas, serves repeated
+    inputs from its cache and reports bad requests.
+
+    :return:
+    """
+    server = SchemaServer(workers=0, cache_size=1)
+    loop = asyncio.new_event_loop()
+    listener = loop.run_until_complete(server.start(port=0))
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', listener.sockets[0].getsockname()[1])
+
+        def post(path, body):
+            connection.request('POST', path, body=body)
+            response = connection.getresponse()
+            return response.status, response.read().decode('utf-8')
+
+        body = json.dumps(test_data)
+        with open(parent_dir + '/tests/test.output.py', 'r') as control:
+            assert(post('/settings', body) == (200, control.read()))
+        assert(post('/settings', body)[0] == 200)
+        status, schema = post('/schema', body)
+        assert(status == 200 and json.loads(schema, object_pairs_hook=OrderedDict) == test_data_answer)
+        assert((server.hits, server.misses, len(server.cache)) == (1, 2, 1))
+
+        assert(post('/schema?list_strategy=last', body)[0] == 400)
+        assert(post('/schema', '{"user": ')[0] == 400)
+        for document in ('[1]', '"x"', '{"user": 1}'):
+            assert(post('/schema', document)[0] == 400)
+        assert(post('/nothing', body)[0] == 404)
+        connection.close()
+    finally:
+        listener.close()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.run_until_complete(listener.wait_closed())
+        loop.close()
+        server.close()
+
+
+def test_output_file_cache():
+    """
+    Tests that cached endpoints are reused and only changed endpoints are
+    parsed again, without changing the output.
+
+    :return:
+    """
+    controlfile = parent_dir + '/tests/test.output.py'
+    with open(controlfile, 'r') as ifile:
+        control = ifile.read()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        outfile = os.path.join(cache_dir, 'settings.py')
+        for hits, misses in ((0, 3), (3, 0)):
+            eg = EveGenie(data=test_data, cache_dir=cache_dir)
+            assert((eg.cache.hits, eg.cache.misses) == (hits, misses))
+            assert(OrderedDict(eg) == test_data_answer)
+            eg.write_file(outfile)
+            with open(outfile, 'r') as ifile:
+                assert(ifile.read() == control)
+
+        changed = OrderedDict(test_data)
+        changed['power-up'] = OrderedDict([('name', 'Star'), ('duration', 10)])
+        eg = EveGenie(data=changed, cache_dir=cache_dir)
+        assert((eg.cache.hits, eg.cache.misses) == (2, 1))
+        assert('duration' in eg['power-up']['schema'])
+
+
+def test_batch_directory():
+    """
+    Tests converting a directory of inputs in one run, reporting failures
+    without stopping the batch.
+
+    :return:
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'test.json'), 'w') as ofile:
+            json.dump(test_data, ofile)
+        with open(os.path.join(tmp, 'broken.json'), 'w') as ofile:
+            ofile.write('{"user": ')
+        with open(os.path.join(tmp, 'notes.txt'), 'w') as ofile:
+            ofile.write('not an input')
+        # a json sidecar written by earlier versions
+        with open(os.path.join(tmp, 'old.settings.domain.json'), 'w') as ofile:
+            json.dump({'old': {'schema': {}}}, ofile)
+        # both would write users.settings.py
+        with open(os.path.join(tmp, 'users.json'), 'w') as ofile:
+            json.dump({'users': {'name': 'x'}}, ofile)
+        with open(os.path.join(tmp, 'users.jsonl'), 'w') as ofile:
+            ofile.write('{"age": 1}\n')
+
+        filenames = geneve.expand_inputs([tmp, os.path.join(tmp, '*.json')])
+        assert([os.path.basename(f) for f in filenames] == ['broken.json', 'test.json', 'users.json', 'users.jsonl'])
+        assert(sorted(geneve.shared_outputs(filenames)) == filenames[2:])
+        assert(geneve.batch(filenames, jobs=2) == 3)
+        assert(not os.path.exists(os.path.join(tmp, 'users.settings.py')))
+
+        with open(os.path.join(tmp, 'test.settings.py'), 'r') as ifile:
+            with open(parent_dir + '/tests/test.output.py', 'r') as control:
+                assert(ifile.read() == control.read())
+
+        # sidecars written by the run aren't inputs of the next one
+        assert(geneve.batch([os.path.join(tmp, 'test.json')], sidecar='json') == 0)
+        assert(geneve.expand_inputs([tmp, os.path.join(tmp, '*.json*')]) == filenames)
+
+
+def test_load_analyzers():
+    """
+    Tests that each input of a run gets record analyzers of its own when
+    they are given by their keyword arguments.
+
+    :return:
+    """
+    options = dict(presence=dict(required=0.5), categorical=dict(max_values=5), ranges=dict(percentiles=None),
+                   formats=dict(threshold=0.5))
+    genies = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ('first', 'second'):
+            filename = os.path.join(tmp, name + '.jsonl')
+            with open(filename, 'w') as ofile:
+                ofile.write('{"name": "a", "size": 1}\n{"name": "b"}\n')
+            genies.append(geneve.load(filename, **options))
+    first, second = genies
+    assert(list(first.presence.endpoints) == ['first'] and list(second.presence.endpoints) == ['second'])
+    assert(first.presence.required == 0.5)
+    assert(list(second.categorical.endpoints) == ['second'] and second.categorical.max_values == 5)
+    assert(list(second.ranges.endpoints) == ['second'] and first.ranges is not second.ranges)
+    assert(list(second.formats.endpoints) == ['second'] and second.formats.threshold == 0.5)
+    assert(second['second']['schema']['size']['required'] is True)
+    assert(options['presence'] == dict(required=0.5) and options['ranges'] == dict(percentiles=None))
+
+
+def test_stats():
+    """
+    Tests that stats record phases, node counts, depth and peak memory of
+    each endpoint without changing the output.
+
+    :return:
+    """
+    phases = []
+    stats = GenieStats(memory=True, profiler=lambda phase: phases.append(phase) or contextlib.nullcontext())
+    eg = EveGenie(data=json.dumps(test_data), stats=stats)
+    assert(OrderedDict(eg) == test_data_answer)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        eg.write_file(os.path.join(tmp, 'settings.py'))
+
+    assert(list(stats.endpoints) == ['user', 'artifact', 'power-up'])
+    assert(stats.nodes['objectid'] == 3)
+    assert(stats.nodes['dict'] == 5)
+    assert(stats.endpoints['artifact'].max_depth == 3)
+    assert(stats.endpoints['power-up'].nodes == {'string': 1})
+    assert(all(e.peak_bytes > 0 for e in stats.endpoints.values()))
+    assert(all(seconds > 0 for seconds in stats.phases.values()))
+    assert(phases.count('parse') == 3 and phases.count('format') == 3)
+    assert(set(stats.as_dict()) == {'phases', 'nodes', 'endpoints'})
+
+
+def test_stats_tracing(monkeypatch):
+    """
+    Tests that peak memory is measured when tracemalloc is already tracing,
+    with and without tracemalloc.reset_peak, which is Python 3.9+.
+
+    :return:
+    """
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        stats = GenieStats(memory=True)
+        with stats.endpoint('big'):
+            data = [str(i) for i in range(10000)]
+        del data
+        assert(stats.endpoints['big'].peak_bytes > 0)
+        assert(tracemalloc.is_tracing())
+
+        monkeypatch.delattr(tracemalloc, 'reset_peak', raising=False)
+        with stats.endpoint('small'):
+            pass
+        with stats.endpoint('bigger'):
+            data = [str(i) for i in range(100000)]
+        del data
+        assert(stats.endpoints['small'].peak_bytes is None)
+        assert(stats.endpoints['bigger'].peak_bytes > 0)
+    finally:
+        tracemalloc.stop()
+
+
+def test_deep_nesting():
+    """
+    Tests that documents nested far deeper than the recursion limit can be
+    parsed, merged and formatted.
+
+    :return:
+    """
+    depth = sys.getrecursionlimit() * 5
+    source = OrderedDict([('leaf', 1)])
+    for i in range(depth):
+        source = OrderedDict([('child', source), ('items', [OrderedDict([('n', i)])])])
+
+    eg = EveGenie(data=OrderedDict([('deep', source)]))
+    item = eg['deep']['schema']['child']
+    for i in range(depth - 1):
+        assert(list(item['schema']) == ['child', 'items'])
+        item = item['schema']['child']
+    assert(item['schema']['leaf'] == OrderedDict([('type', 'integer')]))
+
+    schema = eg.parse_records([source, OrderedDict([('child', None)]), source])
+    assert(schema['child'].nullable is True)
+
+    # without indentation, as indented output grows with the square of depth
+    endpoint = io.StringIO()
+    write_literal(eg['deep'], endpoint, indent=0)
+    assert(endpoint.getvalue().count('\n') > depth * 4)
+
+
 def test_get_type_unicode():
     """
     Test that a unicode string maps to an eve 'string'
@@ -423,6 +1310,20 @@ def test_get_type_fail():
         eg.get_type(source)
 
 
+def test_classify_string_payload():
+    """
+    Test that special strings are classified along with their parsed data.
+
+    :return:
+    """
+    assert(classify_string('objectid:  artifact') == ('objectid', 'artifact'))
+    assert(classify_string('1 - 10') == ('integer', (1, 10)))
+    assert(classify_string('.5-2.5') == ('float', (0.5, 2.5)))
+    assert(classify_string('1.2.3-4') == ('string', None))
+    assert(classify_string('orange') == ('string', None))
+    assert(classify_string('') == ('string', None))
+
+
 def test_evegenie_len():
     """
     Test that an EveGenie object correctly reports its length.
@@ -433,6 +1334,20 @@ def test_evegenie_len():
     assert(len(eg) == 1)
 
 
+def test_schema_node_round_trip():
+    """
+    Test that SchemaNodes convert to and from plain eve schema dicts.
+
+    :return:
+    """
+    eg = EveGenie(data=test_data)
+    for name, schema in eg:
+        node = from_dict(schema)
+        assert(node == eg.endpoints[name])
+        assert(to_dict(node) == test_data_answer[name])
+    assert(isinstance(eg.endpoints['artifact'].schema['name'], SchemaNode))
+
+
 
 if __name__ == '__main__':
     pytest_args = [